@@ -3,12 +3,30 @@ import os
 from datetime import datetime, date, timedelta as dtime
 from pathlib import Path
 from functools import wraps
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import hashlib
+import io
 import json
+import sqlite3
+import threading
+import time
+import unicodedata
 import requests
+import click
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, abort
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, abort, g, jsonify,
+                   Response, stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from flask_migrate import Migrate
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+import metrics
+import query_audit
+from pricing_client import pricing_client
 
 BASE_DIR = Path(__file__).parent
 DATA_DIR = BASE_DIR / "data"
@@ -16,10 +34,63 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'cambiame-por-uno-seguro')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(DATA_DIR / 'subite.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///' + str(DATA_DIR / 'subite.db'))
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
+    # Algunos proveedores todavía entregan el esquema viejo
+    app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace('postgres://', 'postgresql://', 1)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Perfil del engine: SQLite en modo WAL para varios workers; otros motores con pool
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'connect_args': {'timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000},
+    }
+else:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+# Con VIRTUAL_SLOTS los horarios de las plantillas se calculan al leer y
+# sólo se guarda una fila en TripSchedule cuando alguien reserva.
+app.config['VIRTUAL_SLOTS'] = os.getenv('VIRTUAL_SLOTS', '1') != '0'
+# Cotizaciones de la API de distancias: vigencia (segundos) y tamaño del LRU en memoria
+app.config['QUOTE_CACHE_TTL'] = int(os.getenv('QUOTE_CACHE_TTL', 7 * 24 * 3600))
+app.config['QUOTE_CACHE_SIZE'] = int(os.getenv('QUOTE_CACHE_SIZE', 1000))
+app.config['QUOTE_WORKERS'] = int(os.getenv('QUOTE_WORKERS', 4))
+# Vigencia (segundos) de las cotizaciones que /api/quote entrega firmadas al formulario
+app.config['QUOTE_TOKEN_MAX_AGE'] = int(os.getenv('QUOTE_TOKEN_MAX_AGE', 900))
+# /api/quote es público: como mucho QUOTE_RATE_LIMIT pedidos por IP cada QUOTE_RATE_WINDOW segundos
+app.config['QUOTE_RATE_LIMIT'] = int(os.getenv('QUOTE_RATE_LIMIT', 30))
+app.config['QUOTE_RATE_WINDOW'] = int(os.getenv('QUOTE_RATE_WINDOW', 60))
+# Sólo desarrollo/pruebas: avisar N+1 (misma consulta >= QUERY_AUDIT_REPEAT veces
+# en un request) y registrar consultas de más de SLOW_QUERY_MS con su plan
+app.config['QUERY_AUDIT'] = os.getenv('QUERY_AUDIT', '0') == '1'
+app.config['QUERY_AUDIT_REPEAT'] = int(os.getenv('QUERY_AUDIT_REPEAT', 5))
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 100))
+
+@event.listens_for(Engine, 'connect')
+def sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL deja leer mientras otro worker escribe; busy_timeout espera el lock
+       en vez de fallar con "database is locked".
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT_MS']}")
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
+metrics.init_app(app)
+if app.config['QUERY_AUDIT']:
+    query_audit.init_app(app)
+# Si se define, /admin/metrics también acepta "Authorization: Bearer <token>" (para el scraper)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
 
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'subite2025')
 PICKUP_API_URL = os.getenv('PICKUP_API_URL')  # Optional, fallback to demo
@@ -39,6 +110,8 @@ SLOTS_SUNDAY = {
 
 CAPACITY_PER_TRIP = 4
 
+ROUTES = ('RC-CBA', 'CBA-RC')
+
 DESTINOS_RIO_CUARTO = [
     "Plaza General Paz - Rotonda Moretti, Río Cuarto, Córdoba, Argentina",
     "Baigorria 26, Río Cuarto, Córdoba, Argentina",
@@ -58,6 +131,20 @@ class PriceConfig(db.Model):
     key = db.Column(db.String(64), primary_key=True)
     value = db.Column(db.Float, nullable=False)
 
+class CacheVersion(db.Model):
+    """Contador por clave que se incrementa cuando cambian datos cacheados en memoria.
+       Cada worker compara su copia con este número para saber si debe recargar.
+    """
+    key = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class QuoteCacheEntry(db.Model):
+    """Respuesta guardada de la API de precios por distancia (ver cached_quote)."""
+    key = db.Column(db.String(40), primary_key=True)  # sha1 de la consulta normalizada
+    km_price = db.Column(db.Float, nullable=False)
+    value = db.Column(db.Text, nullable=False)  # JSON
+    expires_at = db.Column(db.DateTime, nullable=False)
+
 class RecurringSchedule(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     route = db.Column(db.String(32), nullable=False)
@@ -74,8 +161,20 @@ class TripSchedule(db.Model):
     date = db.Column(db.Date, nullable=False)
     time = db.Column(db.String(5), nullable=False)  # 'HH:MM'
     capacity = db.Column(db.Integer, nullable=False, default=CAPACITY_PER_TRIP)
+    # Asientos ocupados, mantenido junto con SharedBooking (ver reserve_seats/release_seats)
+    seats_taken = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_from_recurring_id = db.Column(db.Integer, db.ForeignKey('recurring_schedule.id'), nullable=True)
+    # Cargado a mano desde el admin ('Solo para este día'): cleanup-slots no lo toca
+    manual = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     recurring_template = db.relationship('RecurringSchedule')
+    __table_args__ = (
+        db.Index('ux_trip_schedule_route_date_time', 'route', 'date', 'time', unique=True),
+        db.Index('ix_trip_schedule_created_from_recurring_id', 'created_from_recurring_id'),
+        # ventanas de fechas sin ruta (admin, limpieza, archivo): el único no sirve
+        db.Index('ix_trip_schedule_date', 'date'),
+        # AUTOINCREMENT: SQLite no reutiliza ids de filas ya archivadas
+        {'sqlite_autoincrement': True},
+    )
 
 class SharedBooking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -91,6 +190,11 @@ class SharedBooking(db.Model):
     pet = db.Column(db.Boolean, default=False)
     total_price = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_shared_booking_schedule_id', 'schedule_id'),
+        db.Index('ix_shared_booking_created_at', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
 
 class ParcelBooking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -106,6 +210,10 @@ class ParcelBooking(db.Model):
     # Agregado: direcciones de retiro y entrega para encomiendas
     pickup_address = db.Column(db.String(200), nullable=True)
     final_address = db.Column(db.String(200), nullable=True)
+    __table_args__ = (
+        db.Index('ix_parcel_booking_created_at', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
 
 class AirportExclusive(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -118,6 +226,10 @@ class AirportExclusive(db.Model):
     final_address = db.Column(db.String(200), nullable=False)
     total_price = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_airport_exclusive_created_at', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
 
 class CityExclusive(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -131,6 +243,10 @@ class CityExclusive(db.Model):
     final_address = db.Column(db.String(200), nullable=False)
     total_price = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_city_exclusive_created_at', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
 
 class AnywhereBooking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -146,36 +262,293 @@ class AnywhereBooking(db.Model):
     email = db.Column(db.String(120), nullable=True)
     total_price = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_anywhere_booking_created_at', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
+
+BOOKING_MODELS = {
+    'shared': SharedBooking,
+    'parcels': ParcelBooking,
+    'airport': AirportExclusive,
+    'exclusive': CityExclusive,
+    'anywhere': AnywhereBooking
+}
+
+def archive_table(model, *indexed):
+    """Tabla fría `<tabla>_archive` con las mismas columnas que `model`, sin
+       claves foráneas ni defaults: las filas se copian tal cual con `flask archive`.
+       Conserva el id original, por eso las tablas vivas usan AUTOINCREMENT.
+    """
+    name = f'{model.__tablename__}_archive'
+    columns = [db.Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+               for c in model.__table__.columns]
+    indexes = [db.Index(f'ix_{name}_{col}', col) for col in indexed]
+    return db.Table(name, *columns, *indexes)
+
+# Viajes ya hechos y sus reservas, fuera de las tablas que se consultan a diario
+ARCHIVE_TABLES = {
+    'trips': archive_table(TripSchedule, 'date'),
+    'shared': archive_table(SharedBooking, 'schedule_id', 'created_at'),
+    'parcels': archive_table(ParcelBooking, 'created_at'),
+    'airport': archive_table(AirportExclusive, 'created_at'),
+    'exclusive': archive_table(CityExclusive, 'created_at'),
+    'anywhere': archive_table(AnywhereBooking, 'created_at'),
+}
+
+BOOKING_LABELS = {
+    'shared': 'Viajes Compartidos',
+    'parcels': 'Encomiendas',
+    'airport': 'Aeropuerto',
+    'exclusive': 'Exclusivo RC↔CBA',
+    'anywhere': 'Cualquier destino'
+}
+
+# Columnas que se leen para listar cada tipo (en shared, fecha/hora/ruta vienen del viaje)
+BOOKING_COLUMNS = {
+    'shared': ['id', 'created_at', 'date', 'time', 'route', 'passengers', 'name', 'phone',
+               'pickup_address', 'final_address', 'total_price'],
+    'parcels': ['id', 'created_at', 'date', 'route', 'parcels', 'name', 'phone',
+                'pickup_address', 'final_address', 'total_price'],
+    'airport': ['id', 'created_at', 'date', 'time', 'name', 'phone',
+                'pickup_address', 'final_address', 'total_price'],
+    'exclusive': ['id', 'created_at', 'date', 'time', 'route', 'name', 'phone',
+                  'pickup_address', 'final_address', 'total_price'],
+    'anywhere': ['id', 'created_at', 'date', 'time', 'origin_city', 'destination_city', 'km_estimate',
+                 'origin_street', 'destination_street', 'name', 'phone', 'total_price'],
+}
+
+QUOTE_MAX_FIELD_LENGTH = 200  # igual que las columnas de dirección
+ADMIN_PAGE_SIZE = 50
+EXPORT_BATCH_SIZE = 500
+SCHEDULES_WINDOW_DAYS = 7
+DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', 60))
 
 # --- Helpers ---
+class TTLCache:
+    """LRU en memoria con vencimiento por entrada. Seguro entre threads."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires=None):
+        with self._lock:
+            self._data[key] = (expires or time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def incr(self, key):
+        """Suma 1 al contador de `key`; si no existe o venció arranca en 1 con
+           el ttl completo. Devuelve el valor nuevo.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            now = time.time()
+            if item is None or item[0] < now:
+                item = (now + self.ttl, 1)
+            else:
+                item = (item[0], item[1] + 1)
+            self._data[key] = item
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+_quote_memory = TTLCache(app.config['QUOTE_CACHE_SIZE'], app.config['QUOTE_CACHE_TTL'])
+# Pedidos a /api/quote por IP en la ventana actual (por worker)
+_quote_throttle = TTLCache(10000, app.config['QUOTE_RATE_WINDOW'])
+
+def normalize_address(text):
+    """'  Av. Colón  100 ' -> 'av. colon 100' (sin tildes, minúsculas, espacios simples)."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+def quote_key(kind, parts, km_price):
+    raw = '|'.join([kind, *(normalize_address(p) for p in parts), repr(float(km_price or 0))])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def cached_quote(kind, parts, km_price, fetch):
+    """Devuelve la cotización guardada para (kind, parts, km_price) o llama a fetch().
+       Primero mira el LRU en memoria, después la tabla QuoteCacheEntry; las
+       respuestas nuevas se guardan en ambos. None no se cachea.
+       La fila se escribe en un SAVEPOINT: no hace commit ni rollback de lo que
+       la vista tenga pendiente; queda guardada cuando quien llama hace commit.
+    """
+    key = quote_key(kind, parts, km_price)
+    value = _quote_memory.get(key)
+    if value is not None:
+        return value
+
+    now = datetime.utcnow()
+    entry = db.session.get(QuoteCacheEntry, key)
+    if entry and entry.expires_at > now:
+        value = json.loads(entry.value)
+        _quote_memory.set(key, value, expires=time.time() + (entry.expires_at - now).total_seconds())
+        return value
+
+    value = fetch()
+    if value is None:
+        return None
+
+    try:
+        with db.session.begin_nested():
+            QuoteCacheEntry.query.filter(QuoteCacheEntry.expires_at <= now).delete()
+            db.session.merge(QuoteCacheEntry(
+                key=key,
+                km_price=float(km_price or 0),
+                value=json.dumps(value),
+                expires_at=now + dtime(seconds=app.config['QUOTE_CACHE_TTL'])
+            ))
+    except Exception as e:
+        print(f"Error al guardar la cotización: {e}")
+    _quote_memory.set(key, value)
+    return value
+
+def _quote_signer():
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='quote')
+
+def sign_quote(kind, parts, km_price, value):
+    """Token corto que el formulario reenvía para no volver a cotizar al confirmar."""
+    return _quote_signer().dumps({'k': quote_key(kind, parts, km_price), 'v': value})
+
+def signed_quotes(tokens):
+    """{quote_key: valor} de los tokens válidos y vigentes; los demás se ignoran."""
+    known = {}
+    for token in tokens:
+        try:
+            data = _quote_signer().loads(token, max_age=app.config['QUOTE_TOKEN_MAX_AGE'])
+        except BadSignature:
+            continue
+        known[data['k']] = data['v']
+    return known
+
+def city_quote_call(known, ciudad, direccion, km_price):
+    """Tupla para fetch_quotes: usa la cotización firmada si coincide con la consulta."""
+    key = quote_key('precio', [ciudad, direccion], km_price)
+    if key in known:
+        return (known.get, key)
+    return (obtener_precio, ciudad, direccion, km_price)
+
+def drop_quote_cache(km_price):
+    """Descarta las cotizaciones calculadas con otro KM_PRICE. No hace commit."""
+    QuoteCacheEntry.query.filter(QuoteCacheEntry.km_price != float(km_price)).delete()
+    _quote_memory.clear()
+
 def obtener_precio(ciudad, llegada, precio_km):
-    url = "https://api.refreshagency.duckdns.org/precio"
+    return cached_quote('precio', [ciudad, llegada], precio_km,
+                        lambda: consultar_precio(ciudad, llegada, precio_km))
+
+def obtener_precio_larga_distancia(ciudad_origen, calle_origen, ciudad_destino, calle_destino, precio_km):
+    quote = cached_quote('precio_general', [ciudad_origen, calle_origen, ciudad_destino, calle_destino], precio_km,
+                         lambda: consultar_precio_larga_distancia(ciudad_origen, calle_origen, ciudad_destino,
+                                                                 calle_destino, precio_km))
+    # una respuesta sin precio (o guardada así antes) no es una cotización
+    if quote is None or quote[0] is None:
+        return None
+    return tuple(quote)
+
+_quote_pool = ThreadPoolExecutor(max_workers=app.config['QUOTE_WORKERS'], thread_name_prefix='quote')
+
+def _run_in_app_context(fn, *args):
+    with app.app_context():
+        result = fn(*args)
+        # la sesión del hilo sólo tiene las cotizaciones que se guardaron en cache
+        db.session.commit()
+        return result
+
+def fetch_quotes(calls):
+    """Ejecuta varias cotizaciones a la vez y devuelve los resultados en orden.
+       calls: lista de tuplas (función, *args), p.ej. (obtener_precio, "cordoba", dir, km).
+       Con una sola llamada no se usa el pool.
+    """
+    if len(calls) <= 1:
+        return [fn(*args) for fn, *args in calls]
+    futures = [_quote_pool.submit(_run_in_app_context, fn, *args) for fn, *args in calls]
+    return [f.result() for f in futures]
+
+@metrics.timed_upstream('consultar_precio')
+def consultar_precio(ciudad, llegada, precio_km):
     payload = {"ciudad": ciudad, "llegada": llegada, "precio_km": precio_km}  # usar 'llegada' en lugar de 'destino'
-    headers = {"Content-Type": "application/json"}
 
     try:
-        response = requests.post(url, data=json.dumps(payload), headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        data = pricing_client.post_json("/precio", payload)
         return data.get("precio")
     except requests.RequestException as e:
         print(f"Error al llamar a la API: {e}")
         return None
 
-def obtener_precio_larga_distancia(ciudad_origen, calle_origen, ciudad_destino, calle_destino, precio_km):
-    url = "https://api.refreshagency.duckdns.org/precio_general"
+@metrics.timed_upstream('consultar_precio_larga_distancia')
+def consultar_precio_larga_distancia(ciudad_origen, calle_origen, ciudad_destino, calle_destino, precio_km):
     payload = {"ciudad_origen": ciudad_origen, "calle_origen": calle_origen, "ciudad_destino": ciudad_destino, "calle_destino": calle_destino, "precio_km": precio_km}  # usar 'llegada' en lugar de 'destino'
-    headers = {"Content-Type": "application/json"}
 
     try:
-        response = requests.post(url, data=json.dumps(payload), headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        data = pricing_client.post_json("/precio_general", payload)
+        if data.get("precio") is None:
+            # sin precio no hay cotización: devolver None para no cachearla
+            print(f"Respuesta sin precio de la API: {data}")
+            return None
         return (data.get("precio"), data.get("km"))
     except requests.RequestException as e:
         print(f"Error al llamar a la API: {e}")
         return None
 
+def cache_version(key):
+    version = db.session.query(CacheVersion.version).filter(CacheVersion.key == key).scalar()
+    return version or 0
+
+def bump_cache_version(key):
+    """Invalida las copias en memoria de `key` en todos los workers. No hace commit.
+       Crea la fila con INSERT que ignora duplicados y después la incrementa, así
+       dos transacciones que tocan una clave nueva a la vez no chocan en el índice.
+    """
+    db.session.execute(insert_ignore(CacheVersion).values(key=key, version=0))
+    db.session.execute(
+        db.update(CacheVersion).where(CacheVersion.key == key)
+        .values(version=CacheVersion.version + 1)
+    )
+
+def cache_versions(*keys):
+    """Versión de varias claves en una sola consulta (0 si nunca se tocaron)."""
+    rows = dict(db.session.query(CacheVersion.key, CacheVersion.version)
+                .filter(CacheVersion.key.in_(keys)).all())
+    return [rows.get(k, 0) for k in keys]
+
+def slots_version_keys(route, on_date):
+    """Claves de versión de la disponibilidad de un día: la de la ruta cambia
+       con las plantillas, la del día con reservas y horarios sueltos.
+    """
+    return (f'slots:{route}', f'slots:{route}:{on_date.isoformat()}')
+
+def bump_slots_version(route, on_date=None):
+    """Invalida la disponibilidad de una ruta en una fecha (o en todas si on_date
+       es None). No hace commit.
+    """
+    if on_date is None:
+        bump_cache_version(f'slots:{route}')
+    else:
+        bump_cache_version(slots_version_keys(route, on_date)[1])
+
 def seed_prices():
     seed_path = DATA_DIR / 'pricing_seed.json'
     if seed_path.exists():
@@ -183,61 +556,529 @@ def seed_prices():
         for k, v in data.items():
             if not PriceConfig.query.get(k):
                 db.session.add(PriceConfig(key=k, value=float(v)))
+        bump_cache_version('prices')
         db.session.commit()
 
+# Copia local de PriceConfig: (versión, {key: value}). Se recarga sólo cuando
+# cambia CacheVersion['prices'], que se consulta una vez por request.
+_price_snapshot = (None, {})
+
+def price_snapshot():
+    global _price_snapshot
+    if 'prices_version' not in g:
+        g.prices_version = cache_version('prices')
+    version, values = _price_snapshot
+    if version != g.prices_version:
+        values = dict(db.session.query(PriceConfig.key, PriceConfig.value).all())
+        _price_snapshot = (g.prices_version, values)
+    return values
+
 def price(key, default=0.0):
-    pc = PriceConfig.query.get(key)
-    return pc.value if pc else default
+    return price_snapshot().get(key, default)
 
 def ensure_day_slots(route, on_date):
     """Crear los horarios esperados para una ruta y fecha DESDE LA BD.
        Usa la tabla RecurringSchedule según el día de la semana.
     """
-    
-    # 1. Obtener el día de la semana (0=Lunes, 6=Domingo)
-    day_num = on_date.weekday()
-    
-    # 2. Buscar las plantillas recurrentes para ese día y ruta
-    slot_templates = RecurringSchedule.query.filter_by(
-        route=route, 
-        day_of_week=day_num
-    ).all()
-
-    # 3. Asegurar que existan en TripSchedule
-    for template in slot_templates:
-        exists = TripSchedule.query.filter_by(
-            route=route, 
-            date=on_date, 
-            time=template.time
-        ).first()
-        
-        if not exists:
-            db.session.add(TripSchedule(
-                route=route, 
-                date=on_date, 
-                time=template.time, 
-                capacity=template.capacity,
-                created_from_recurring_id=template.id # Guardamos la referencia
-            ))
+    materialize_slots(on_date, on_date, route)
+
+class VirtualSlot:
+    """Horario que sale de una plantilla y todavía no tiene fila en TripSchedule."""
+    id = None
+    seats_taken = 0
+
+    def __init__(self, template, on_date):
+        self.route = template.route
+        self.date = on_date
+        self.time = template.time
+        self.capacity = template.capacity
+        self.created_from_recurring_id = template.id
+        self.recurring_template = template
+
+def expand_slots(start, end, route=None):
+    """Horarios entre start y end (inclusive) SIN escribir en la BD.
+       Combina las filas de TripSchedule con las plantillas de RecurringSchedule;
+       los huecos se completan con VirtualSlot. Orden: fecha, ruta, hora.
+       Las filas con capacity=0 son horarios cancelados: tapan a la plantilla
+       pero no se devuelven.
+    """
+    trips = TripSchedule.query.filter(TripSchedule.date.between(start, end))
+    templates = RecurringSchedule.query
+    if route:
+        trips = trips.filter(TripSchedule.route == route)
+        templates = templates.filter(RecurringSchedule.route == route)
+
+    slots = {(s.route, s.date, s.time): s for s in trips.all()}
+
+    templates_by_day = defaultdict(list)
+    for t in templates.all():
+        templates_by_day[t.day_of_week].append(t)
+
+    on_date = start
+    while on_date <= end:
+        for t in templates_by_day[on_date.weekday()]:
+            key = (t.route, on_date, t.time)
+            if key not in slots:
+                slots[key] = VirtualSlot(t, on_date)
+        on_date += dtime(days=1)
+
+    return sorted((s for s in slots.values() if s.capacity > 0), key=lambda s: (s.date, s.route, s.time))
+
+def insert_ignore(model):
+    """INSERT que saltea las filas que violan un índice único en vez de fallar."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(model).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(model).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        return db.insert(model).prefix_with('IGNORE')
+    return db.insert(model)
+
+def materialize_slot(slot):
+    """Devuelve el TripSchedule de un horario, creándolo si era virtual. No hace commit.
+       Si otro pedido lo crea al mismo tiempo, el índice único evita el duplicado.
+    """
+    if slot.id is not None:
+        return slot
+    db.session.execute(insert_ignore(TripSchedule).values(
+        route=slot.route,
+        date=slot.date,
+        time=slot.time,
+        capacity=slot.capacity,
+        seats_taken=0,
+        created_from_recurring_id=slot.created_from_recurring_id
+    ))
+    return TripSchedule.query.filter_by(route=slot.route, date=slot.date, time=slot.time).one()
+
+def get_slot_or_404(schedule_id=None, route=None, slot_date=None, slot_time=None):
+    """Busca un horario por id o, si es virtual, por (ruta, fecha, hora)."""
+    if schedule_id is not None:
+        return TripSchedule.query.get_or_404(schedule_id)
+    try:
+        on_date = datetime.strptime(slot_date, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        abort(404)
+    for s in expand_slots(on_date, on_date, route):
+        if s.time == slot_time:
+            return s
+    abort(404)
+
+def materialize_slots(start, end, route=None, template_id=None):
+    """Crea de una vez las filas de TripSchedule que faltan entre start y end.
+       Calcula los huecos con expand_slots y los inserta en un solo INSERT;
+       con template_id sólo se crean los de esa plantilla.
+       Devuelve la cantidad de horarios creados.
+    """
+    rows = [
+        {
+            'route': s.route,
+            'date': s.date,
+            'time': s.time,
+            'capacity': s.capacity,
+            'seats_taken': 0,
+            'created_from_recurring_id': s.created_from_recurring_id,
+        }
+        for s in expand_slots(start, end, route)
+        if s.id is None and template_id in (None, s.created_from_recurring_id)
+    ]
+    if rows:
+        db.session.execute(insert_ignore(TripSchedule), rows)
     db.session.commit()
+    return len(rows)
+
+@app.template_global()
+def slot_key(slot):
+    """'ruta|fecha|hora' de un horario, para los formularios del admin."""
+    return f"{slot.route}|{slot.date.isoformat()}|{slot.time}"
+
+def parse_slot_key(value):
+    """Inverso de slot_key: (ruta, fecha, hora), o None si no es válido."""
+    try:
+        route, on_date, slot_time = (value or '').split('|')
+        on_date = datetime.strptime(on_date, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    if route not in ROUTES or not slot_time:
+        return None
+    return route, on_date, slot_time
+
+@app.template_global()
+def slot_url(endpoint, slot, **params):
+    """URL de reserva para un horario, tenga o no fila en TripSchedule."""
+    if slot.id is not None:
+        return url_for(endpoint, schedule_id=slot.id, **params)
+    return url_for(endpoint, route=slot.route, slot_date=slot.date.isoformat(),
+                   slot_time=slot.time, **params)
+
+def reserve_seats(schedule_id, passengers):
+    """Ocupa asientos con un UPDATE condicional (sin leer antes el cupo).
+       Devuelve False si el horario no tiene lugar o `passengers` no es positivo;
+       no hace commit.
+    """
+    if passengers < 1:
+        return False
+    result = db.session.execute(
+        db.update(TripSchedule)
+        .where(TripSchedule.id == schedule_id,
+               TripSchedule.seats_taken + passengers <= TripSchedule.capacity)
+        .values(seats_taken=TripSchedule.seats_taken + passengers)
+    )
+    return result.rowcount == 1
+
+def release_seats(passengers_by_schedule):
+    """Devuelve asientos a los horarios ({schedule_id: pasajeros}) al borrar
+       reservas, en un solo executemany. No hace commit.
+    """
+    if not passengers_by_schedule:
+        return
+    trips = TripSchedule.__table__
+    n = db.bindparam('n')
+    db.session.execute(
+        trips.update()
+        .where(trips.c.id == db.bindparam('sid'))
+        .values(seats_taken=db.case((trips.c.seats_taken > n, trips.c.seats_taken - n), else_=0)),
+        [{'sid': sid, 'n': passengers} for sid, passengers in passengers_by_schedule.items()]
+    )
 
-def booked_seats(schedule_id):
-    total = db.session.query(db.func.sum(SharedBooking.passengers)).filter(SharedBooking.schedule_id == schedule_id).scalar()
-    return int(total or 0)
+def delete_bookings(btype, ids):
+    """Borra reservas de un tipo con un único DELETE. Para las compartidas
+       libera los asientos de cada horario e invalida su disponibilidad.
+       Devuelve la cantidad borrada; no hace commit.
+    """
+    Model = BOOKING_MODELS[btype]
+    if btype == 'shared':
+        freed = db.session.query(
+            SharedBooking.schedule_id, TripSchedule.route, TripSchedule.date,
+            db.func.sum(SharedBooking.passengers)
+        ).join(TripSchedule, SharedBooking.schedule_id == TripSchedule.id) \
+         .filter(SharedBooking.id.in_(ids)) \
+         .group_by(SharedBooking.schedule_id, TripSchedule.route, TripSchedule.date).all()
+        release_seats({sid: int(passengers) for sid, _, _, passengers in freed})
+        for route, on_date in {(route, on_date) for _, route, on_date, _ in freed}:
+            bump_slots_version(route, on_date)
+    deleted = db.session.execute(
+        db.delete(Model).where(Model.id.in_(ids)),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if deleted:
+        bump_cache_version('bookings')
+    return deleted
+
+def delete_schedules(ids, slots=()):
+    """Borra los horarios de `ids` que no tienen reservas y los virtuales de
+       `slots` (tuplas ruta, fecha, hora). Los que salen de una plantilla no
+       se pueden borrar sin más porque expand_slots los volvería a mostrar: se
+       cancelan dejando (o creando) su fila con capacity=0.
+       Devuelve (borrados, con_reservas); no hace commit.
+    """
+    ids = set(ids)
+    slots = set(slots)
+    if slots:
+        # Los virtuales que mientras tanto ya tienen fila se tratan por id
+        dates = {on_date for _, on_date, _ in slots}
+        for sid, route, on_date, t in db.session.query(
+                TripSchedule.id, TripSchedule.route, TripSchedule.date, TripSchedule.time) \
+                .filter(TripSchedule.date.in_(dates)):
+            if (route, on_date, t) in slots:
+                slots.discard((route, on_date, t))
+                ids.add(sid)
+
+    has_bookings = db.exists().where(SharedBooking.schedule_id == TripSchedule.id)
+    free = db.session.query(
+        TripSchedule.id, TripSchedule.route, TripSchedule.date,
+        db.or_(TripSchedule.created_from_recurring_id.isnot(None), template_exists()).label('templated')
+    ).filter(TripSchedule.id.in_(ids), ~has_bookings).all() if ids else []
+    cancel = [s.id for s in free if s.templated]
+    delete = [s.id for s in free if not s.templated]
+    if cancel:
+        db.session.execute(
+            db.update(TripSchedule).where(TripSchedule.id.in_(cancel)).values(capacity=0),
+            execution_options={'synchronize_session': False}
+        )
+    if delete:
+        db.session.execute(
+            db.delete(TripSchedule).where(TripSchedule.id.in_(delete)),
+            execution_options={'synchronize_session': False}
+        )
+    changed = {(s.route, s.date) for s in free}
+
+    virtual = []
+    if slots:
+        templates = {(t.route, t.day_of_week, t.time): t.id for t in
+                     RecurringSchedule.query.filter(RecurringSchedule.route.in_({r for r, _, _ in slots}))}
+        for route, on_date, t in slots:
+            template_id = templates.get((route, on_date.weekday(), t))
+            if template_id is not None:
+                virtual.append({'route': route, 'date': on_date, 'time': t, 'capacity': 0,
+                                'seats_taken': 0, 'created_from_recurring_id': template_id})
+        if virtual:
+            db.session.execute(insert_ignore(TripSchedule), virtual)
+            changed.update((v['route'], v['date']) for v in virtual)
+
+    for route, on_date in changed:
+        bump_slots_version(route, on_date)
+    return len(free) + len(virtual), len(ids) - len(free)
+
+def day_availability(route, on_date, passengers):
+    """Horarios de una ruta y fecha con sus cupos libres.
+       Devuelve una lista de (schedule, libres, alcanza_para_passengers).
+    """
+    if app.config['VIRTUAL_SLOTS']:
+        schedules = expand_slots(on_date, on_date, route)
+    else:
+        ensure_day_slots(route, on_date)
+        # capacity=0: horario cancelado
+        schedules = TripSchedule.query.filter_by(route=route, date=on_date) \
+            .filter(TripSchedule.capacity > 0).order_by(TripSchedule.time.asc()).all()
+
+    # si la fecha es hoy filtrar horarios pasados
+    if on_date == date.today():
+        now = now_hhmm()
+        schedules = [s for s in schedules if s.time >= now]
+
+    availability = []
+    for s in schedules:
+        free = max(0, s.capacity - s.seats_taken)
+        availability.append((s, free, free >= passengers))
+    return availability
+
+def parse_month(value):
+    """'YYYY-MM' -> primer día de ese mes; None si no es válido."""
+    try:
+        return datetime.strptime(value or '', '%Y-%m').date()
+    except ValueError:
+        return None
 
+def month_occupancy(route, month_start, passengers=1):
+    """Grilla fecha × hora de salida con los lugares libres de un mes.
+       Plantillas y viajes del mes salen de una sola consulta (UNION ALL);
+       la ocupación es la columna seats_taken, así que no hay un SUM por horario.
+       Devuelve (horas, días) donde cada día es {'date', 'cells': {hora: celda}}.
+    """
+    next_month = (month_start + dtime(days=31)).replace(day=1)
+    start = max(month_start, date.today())
+    end = next_month - dtime(days=1)
+    if start > end:
+        return [], []
+
+    templates = db.select(
+        db.literal(None, db.Integer).label('id'),
+        RecurringSchedule.day_of_week.label('day_of_week'),
+        db.literal(None, db.Date).label('date'),
+        RecurringSchedule.time.label('time'),
+        RecurringSchedule.capacity.label('capacity'),
+        db.literal(0).label('seats_taken'),
+    ).where(RecurringSchedule.route == route)
+    trips = db.select(
+        TripSchedule.id,
+        db.literal(-1),
+        TripSchedule.date,
+        TripSchedule.time,
+        TripSchedule.capacity,
+        TripSchedule.seats_taken,
+    ).where(TripSchedule.route == route, TripSchedule.date.between(start, end))
+    rows = db.session.execute(db.union_all(templates, trips)).all()
+
+    templates_by_day = defaultdict(list)
+    trips_by_day = defaultdict(list)
+    for row in rows:
+        if row.date is None:
+            templates_by_day[row.day_of_week].append(row)
+        else:
+            trips_by_day[row.date].append(row)
+
+    today, now = date.today(), now_hhmm()
+    times = set()
+    days = []
+    on_date = start
+    while on_date <= end:
+        # igual que expand_slots: la fila del viaje pisa a la plantilla
+        slots = {r.time: r for r in templates_by_day[on_date.weekday()]}
+        slots.update((r.time, r) for r in trips_by_day[on_date])
+        cells = {}
+        for t, r in slots.items():
+            if on_date == today and t < now or r.capacity <= 0:  # pasado o cancelado
+                continue
+            free = max(0, r.capacity - r.seats_taken)
+            if r.id is not None:
+                url = url_for('shared_book', schedule_id=r.id, p=passengers)
+            else:
+                url = url_for('shared_book', route=route, slot_date=on_date.isoformat(), slot_time=t, p=passengers)
+            cells[t] = {'free': free, 'capacity': r.capacity, 'bookable': free >= passengers, 'url': url}
+        times.update(cells)
+        days.append({'date': on_date, 'cells': cells})
+        on_date += dtime(days=1)
+    return sorted(times), days
+
+@metrics.timed_upstream('pickup_surcharge')
 def pickup_surcharge(address: str) -> float:
     # If external API is configured, try it. Expecting it to return {"surcharge": number}
     if PICKUP_API_URL:
         try:
-            resp = requests.post(PICKUP_API_URL, json={"address": address}, timeout=6)
-            if resp.ok:
-                data = resp.json()
-                return float(data.get("surcharge", 0.0))
+            data = pricing_client.post_json(PICKUP_API_URL, {"address": address})
+            return float(data.get("surcharge", 0.0))
         except Exception:
             pass
     # Demo fallback
     return 3000.0 if address and address.strip() else 0.0
 
+def booking_source(btype, archived=False):
+    """Modelo de un tipo de reserva ('trips' para TripSchedule), o las columnas
+       de su tabla de archivo. En ambos casos se accede a las columnas por atributo.
+    """
+    if archived:
+        return ARCHIVE_TABLES[btype].c
+    return TripSchedule if btype == 'trips' else BOOKING_MODELS[btype]
+
+def booking_column(btype, name, archived=False):
+    """Columna `name` de un tipo de reserva (None si ese tipo no la tiene)."""
+    if btype == 'shared' and name in ('date', 'time', 'route'):
+        return getattr(booking_source('trips', archived), name)
+    return getattr(booking_source(btype, archived), name, None)
+
+def booking_query(btype, filter_by_date='all', filter_by_route='all', archived=False):
+    """Consulta de un tipo de reserva con los filtros del admin ('day'/'week'/'all'
+       y ruta), leyendo sólo BOOKING_COLUMNS. Las filas se acceden por nombre.
+       Con archived=True lee las tablas de archivo.
+    """
+    query = db.session.query(*[booking_column(btype, c, archived).label(c) for c in BOOKING_COLUMNS[btype]])
+    if btype == 'shared':
+        bookings, trips = booking_source('shared', archived), booking_source('trips', archived)
+        query = query.select_from(ARCHIVE_TABLES['shared'] if archived else SharedBooking) \
+            .join(ARCHIVE_TABLES['trips'] if archived else TripSchedule, bookings.schedule_id == trips.id)
+
+    date_col = booking_column(btype, 'date', archived)
+    today = date.today()
+    if filter_by_date == 'day':
+        query = query.filter(date_col == today)
+    elif filter_by_date == 'week':
+        start_of_week = today - dtime(days=today.weekday())
+        end_of_week = start_of_week + dtime(days=6)
+        query = query.filter(date_col.between(start_of_week, end_of_week))
+
+    route_col = booking_column(btype, 'route', archived)
+    if filter_by_route in ROUTES and route_col is not None:
+        query = query.filter(route_col == filter_by_route)
+    return query
+
+def keyset_page(query, Model, cursor=None, size=ADMIN_PAGE_SIZE):
+    """Página ordenada por (created_at, id) descendente que empieza después de `cursor`.
+       `Model` es el modelo o las columnas de la tabla de archivo (booking_source).
+       Devuelve (filas, cursor_siguiente); el cursor es None en la última página.
+    """
+    if cursor:
+        try:
+            ts, last_id = cursor.rsplit('_', 1)
+            ts, last_id = datetime.fromisoformat(ts), int(last_id)
+        except ValueError:
+            pass
+        else:
+            query = query.filter(db.or_(
+                Model.created_at < ts,
+                db.and_(Model.created_at == ts, Model.id < last_id)
+            ))
+    rows = query.order_by(Model.created_at.desc(), Model.id.desc()).limit(size + 1).all()
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = f"{rows[-1].created_at.isoformat()}_{rows[-1].id}"
+    return rows, next_cursor
+
+def compute_dashboard_stats(today=None):
+    """Totales del panel en UNA consulta: por tipo de reserva cantidad total, de
+       hoy y de la semana (por fecha de viaje) e ingresos; por ruta, asientos
+       ocupados / capacidad de los horarios de los próximos 7 días. Como en
+       expand_slots, la capacidad suma los viajes y las plantillas que todavía
+       no tienen fila ese día.
+    """
+    today = today or date.today()
+    start_of_week = today - dtime(days=today.weekday())
+    end_of_week = start_of_week + dtime(days=6)
+
+    columns, subqueries = [], []
+    for btype, Model in BOOKING_MODELS.items():
+        date_col = booking_column(btype, 'date')
+        in_week = date_col.between(start_of_week, end_of_week)
+        sq = db.select(
+            db.func.count().label('total'),
+            db.func.coalesce(db.func.sum(db.case((date_col == today, 1), else_=0)), 0).label('today'),
+            db.func.coalesce(db.func.sum(db.case((in_week, 1), else_=0)), 0).label('week'),
+            db.func.coalesce(db.func.sum(Model.total_price), 0).label('revenue'),
+            db.func.coalesce(db.func.sum(db.case((in_week, Model.total_price), else_=0)), 0).label('week_revenue'),
+        ).select_from(Model)
+        if btype == 'shared':
+            sq = sq.join(TripSchedule, SharedBooking.schedule_id == TripSchedule.id)
+        sq = sq.subquery(btype)
+        subqueries.append(sq)
+        columns += [c.label(f'{btype}__{c.name}') for c in sq.c]
+
+    upcoming = TripSchedule.date.between(today, today + dtime(days=6))
+    trip_columns = [db.func.count().label('schedules')]
+    for route in ROUTES:
+        in_route = db.and_(upcoming, TripSchedule.route == route)
+        trip_columns += [
+            db.func.coalesce(db.func.sum(db.case((in_route, TripSchedule.seats_taken), else_=0)), 0).label(f'{route}__taken'),
+            db.func.coalesce(db.func.sum(db.case((in_route, TripSchedule.capacity), else_=0)), 0).label(f'{route}__capacity'),
+        ]
+    trips = db.select(*trip_columns).select_from(TripSchedule).subquery('trips')
+    subqueries.append(trips)
+    columns += list(trips.c)
+
+    # En 7 días cada plantilla cae una sola vez: su fecha sale del día de semana
+    template_date = db.case(
+        {(today + dtime(days=i)).weekday(): today + dtime(days=i) for i in range(7)},
+        value=RecurringSchedule.day_of_week,
+    )
+    has_trip = db.exists().where(
+        TripSchedule.route == RecurringSchedule.route,
+        TripSchedule.time == RecurringSchedule.time,
+        TripSchedule.date == template_date,
+    )
+    templates = db.select(*[
+        db.func.coalesce(db.func.sum(db.case((RecurringSchedule.route == route, RecurringSchedule.capacity),
+                                             else_=0)), 0).label(f'{route}__template_capacity')
+        for route in ROUTES
+    ]).where(~has_trip).subquery('templates')
+    subqueries.append(templates)
+    columns += list(templates.c)
+
+    # Cada subconsulta devuelve una sola fila: las unimos sin condición
+    joined = subqueries[0]
+    for sq in subqueries[1:]:
+        joined = joined.join(sq, db.true())
+    row = db.session.execute(db.select(*columns).select_from(joined)).one()._mapping
+
+    stats = {'bookings': {}, 'occupancy': {}, 'schedules': row['schedules']}
+    for btype in BOOKING_MODELS:
+        stats['bookings'][btype] = {k: row[f'{btype}__{k}'] for k in ('total', 'today', 'week', 'revenue', 'week_revenue')}
+    for route in ROUTES:
+        taken = row[f'{route}__taken']
+        capacity = row[f'{route}__capacity'] + row[f'{route}__template_capacity']
+        stats['occupancy'][route] = {
+            'taken': taken,
+            'capacity': capacity,
+            'pct': round(100.0 * taken / capacity) if capacity else 0,
+        }
+    return stats
+
+# Copia local del panel: (versión de 'bookings', vence, stats)
+_dashboard_cache = (None, 0, None)
+
+def dashboard_stats():
+    """compute_dashboard_stats cacheado DASHBOARD_CACHE_TTL segundos; se recalcula
+       antes si alguna reserva cambió (CacheVersion['bookings']).
+    """
+    global _dashboard_cache
+    version = cache_version('bookings')
+    cached_version, expires, stats = _dashboard_cache
+    if stats is None or cached_version != version or expires < time.time():
+        stats = compute_dashboard_stats()
+        _dashboard_cache = (version, time.time() + DASHBOARD_CACHE_TTL, stats)
+    return stats
+
 def login_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -252,6 +1093,9 @@ def now_hhmm():
 def seed_recurring_schedules():
     """Puebla la tabla RecurringSchedule desde los diccionarios fijos."""
     print("Poblando horarios recurrentes...")
+    # Los viajes existentes quedan sin plantilla (backfill-links los vuelve a vincular)
+    TripSchedule.query.filter(TripSchedule.created_from_recurring_id.isnot(None)) \
+        .update({TripSchedule.created_from_recurring_id: None})
     db.session.query(RecurringSchedule).delete() # Borra todos para empezar de 0
     
     try:
@@ -303,19 +1147,7 @@ def shared():
             flash('Fecha inválida', 'error')
             return redirect(url_for('shared'))
 
-        ensure_day_slots(route, on_date)
-        # List availability: si la fecha es hoy filtrar horarios pasados
-        if on_date == date.today():
-            now = now_hhmm()
-            schedules = TripSchedule.query.filter_by(route=route, date=on_date).filter(TripSchedule.time >= now).order_by(TripSchedule.time.asc()).all()
-        else:
-            schedules = TripSchedule.query.filter_by(route=route, date=on_date).order_by(TripSchedule.time.asc()).all()
-
-        availability = []
-        for s in schedules:
-            taken = booked_seats(s.id)
-            free = max(0, s.capacity - taken)
-            availability.append((s, free, free >= passengers))
+        availability = day_availability(route, on_date, passengers)
         return render_template('shared_slots.html', route=route, on_date=on_date, passengers=passengers, availability=availability)
 
     # GET inicial
@@ -323,8 +1155,9 @@ def shared():
     return render_template('shared.html', today=today.isoformat(), form_data={})
 
 @app.route('/shared/book/<int:schedule_id>', methods=['GET', 'POST'])
-def shared_book(schedule_id):
-    sch = TripSchedule.query.get_or_404(schedule_id)
+@app.route('/shared/book/<route>/<slot_date>/<slot_time>', methods=['GET', 'POST'])
+def shared_book(schedule_id=None, route=None, slot_date=None, slot_time=None):
+    sch = get_slot_or_404(schedule_id, route, slot_date, slot_time)
 
     # evitar reservar un horario que ya pasó si es hoy
     if sch.date == date.today():
@@ -332,9 +1165,14 @@ def shared_book(schedule_id):
             flash('Ese horario ya pasó y no puede reservarse.', 'error')
             return redirect(url_for('shared'))
 
-    passengers = int(request.args.get('p', 1))
-    taken = booked_seats(schedule_id)
-    free = sch.capacity - taken
+    try:
+        passengers = int(request.args.get('p', 1))
+    except ValueError:
+        passengers = 0
+    if not 1 <= passengers <= sch.capacity:
+        flash('Cantidad de pasajeros inválida.', 'error')
+        return redirect(url_for('shared'))
+    free = sch.capacity - sch.seats_taken
     if passengers > free:
         flash('Ese horario ya no tiene cupo suficiente.', 'error')
         return redirect(url_for('shared'))
@@ -360,21 +1198,30 @@ def shared_book(schedule_id):
         extra_luggage = bool(request.form.get('extra_luggage'))
         pet = bool(request.form.get('pet'))
 
-        surcharge = 0.0
+        quotes = []
+        # Cotizaciones ya hechas por /api/quote mientras se completaba el formulario
+        known = signed_quotes(request.form.getlist('quote_token'))
         # Si seleccionó "Otro", usamos la dirección personalizada
         if final_address == "otro" and final_address_custom:
             final_address = final_address_custom
             # Costo adicional si la ciudad es Córdoba
             if sch.route == 'RC-CBA':
-                km_price = price("KM_PRICE")
-                surcharge += obtener_precio("cordoba", final_address, km_price)
+                quotes.append(city_quote_call(known, "cordoba", final_address, price("KM_PRICE")))
         
         if pickup_address == "otro" and pickup_address_custom:
             pickup_address = pickup_address_custom
             # Costo adicional si la ciudad es Córdoba
             if sch.route == 'CBA-RC':
-                km_price = price("KM_PRICE")
-                surcharge += obtener_precio("cordoba", pickup_address, km_price)
+                quotes.append(city_quote_call(known, "cordoba", pickup_address, price("KM_PRICE")))
+
+        # Las cotizaciones se piden en paralelo: se espera sólo la más lenta
+        surcharges = fetch_quotes(quotes)
+        if None in surcharges:
+            # API de precios caída (o breaker abierto): no se reserva sin precio
+            db.session.rollback()
+            flash('No se pudo calcular el precio en este momento. Intentá de nuevo en unos minutos.', 'error')
+            return redirect(request.url)
+        surcharge = sum(surcharges, 0.0)
 
         base = price('BASE_SHARED_RC_CBA' if sch.route=='RC-CBA' else 'BASE_SHARED_CBA_RC', 9000.0)
         subtotal = base * passengers
@@ -383,6 +1230,14 @@ def shared_book(schedule_id):
         if pet: extras += price('PET', 10000.0)
         total = subtotal + extras + surcharge
 
+        # Recién al reservar se crea la fila del horario (si era virtual)
+        sch = materialize_slot(sch)
+        # Reserva atómica: si otro pedido ocupó los lugares, no sobrevendemos
+        if not reserve_seats(sch.id, passengers):
+            db.session.rollback()
+            flash('Ese horario ya no tiene cupo suficiente.', 'error')
+            return redirect(url_for('shared'))
+
         booking = SharedBooking(
             schedule_id=sch.id,
             passengers=passengers,
@@ -396,6 +1251,8 @@ def shared_book(schedule_id):
             total_price=total
         )
         db.session.add(booking)
+        bump_cache_version('bookings')
+        bump_slots_version(sch.route, sch.date)
         db.session.commit()
 
         return render_template('confirm.html', category='Viaje Compartido', total=total, details={
@@ -419,8 +1276,9 @@ def shared_book(schedule_id):
 
 
 @app.route('/airport_shared/book/<int:schedule_id>', methods=['GET', 'POST'])
-def airport_book(schedule_id):
-    sch = TripSchedule.query.get_or_404(schedule_id)
+@app.route('/airport_shared/book/<route>/<slot_date>/<slot_time>', methods=['GET', 'POST'])
+def airport_book(schedule_id=None, route=None, slot_date=None, slot_time=None):
+    sch = get_slot_or_404(schedule_id, route, slot_date, slot_time)
 
     # evitar reservar un horario que ya pasó si es hoy
     if sch.date == date.today():
@@ -428,9 +1286,14 @@ def airport_book(schedule_id):
             flash('Ese horario ya pasó y no puede reservarse.', 'error')
             return redirect(url_for('airport_shared'))
 
-    passengers = int(request.args.get('p', 1))
-    taken = booked_seats(schedule_id)
-    free = sch.capacity - taken
+    try:
+        passengers = int(request.args.get('p', 1))
+    except ValueError:
+        passengers = 0
+    if not 1 <= passengers <= sch.capacity:
+        flash('Cantidad de pasajeros inválida.', 'error')
+        return redirect(url_for('airport_shared'))
+    free = sch.capacity - sch.seats_taken
     if passengers > free:
         flash('Ese horario ya no tiene cupo suficiente.', 'error')
         return redirect(url_for('shared'))
@@ -456,21 +1319,30 @@ def airport_book(schedule_id):
         extra_luggage = bool(request.form.get('extra_luggage'))
         pet = bool(request.form.get('pet'))
 
-        surcharge = 0.0
+        quotes = []
+        # Cotizaciones ya hechas por /api/quote mientras se completaba el formulario
+        known = signed_quotes(request.form.getlist('quote_token'))
         # Si seleccionó "Otro", usamos la dirección personalizada
         if final_address == "otro" and final_address_custom:
             final_address = final_address_custom
             # Costo adicional si la ciudad es Córdoba
             if sch.route == 'RC-CBA':
-                km_price = price("KM_PRICE")
-                surcharge += obtener_precio("cordoba", final_address, km_price)
+                quotes.append(city_quote_call(known, "cordoba", final_address, price("KM_PRICE")))
         
         if pickup_address == "otro" and pickup_address_custom:
             pickup_address = pickup_address_custom
             # Costo adicional si la ciudad es Córdoba
             if sch.route == 'CBA-RC':
-                km_price = price("KM_PRICE")
-                surcharge += obtener_precio("cordoba", pickup_address, km_price)
+                quotes.append(city_quote_call(known, "cordoba", pickup_address, price("KM_PRICE")))
+
+        # Las cotizaciones se piden en paralelo: se espera sólo la más lenta
+        surcharges = fetch_quotes(quotes)
+        if None in surcharges:
+            # API de precios caída (o breaker abierto): no se reserva sin precio
+            db.session.rollback()
+            flash('No se pudo calcular el precio en este momento. Intentá de nuevo en unos minutos.', 'error')
+            return redirect(request.url)
+        surcharge = sum(surcharges, 0.0)
 
         base = price("BASE_SHARED_AIRPORT")
         subtotal = base * passengers
@@ -479,6 +1351,14 @@ def airport_book(schedule_id):
         if pet: extras += price('PET', 10000.0)
         total = subtotal + extras + surcharge
 
+        # Recién al reservar se crea la fila del horario (si era virtual)
+        sch = materialize_slot(sch)
+        # Reserva atómica: si otro pedido ocupó los lugares, no sobrevendemos
+        if not reserve_seats(sch.id, passengers):
+            db.session.rollback()
+            flash('Ese horario ya no tiene cupo suficiente.', 'error')
+            return redirect(url_for('airport_shared'))
+
         booking = SharedBooking(
             schedule_id=sch.id,
             passengers=passengers,
@@ -492,6 +1372,8 @@ def airport_book(schedule_id):
             total_price=total
         )
         db.session.add(booking)
+        bump_cache_version('bookings')
+        bump_slots_version(sch.route, sch.date)
         db.session.commit()
 
         return render_template('confirm.html', category='Viaje Compartido', total=total, details={
@@ -551,6 +1433,7 @@ def parcels():
             total_price=total
         )
         db.session.add(booking)
+        bump_cache_version('bookings')
         db.session.commit()
         return render_template('confirm.html', category='Encomienda', total=total, details={
             'Ruta': 'Río Cuarto → Córdoba' if route=='RC-CBA' else 'Córdoba → Río Cuarto',
@@ -616,6 +1499,7 @@ def airport():
             total_price=total
         )
         db.session.add(b)
+        bump_cache_version('bookings')
         db.session.commit()
 
         return render_template('confirm.html', category='Aeropuerto Exclusivo', total=total, details={
@@ -691,6 +1575,7 @@ def exclusive():
             total_price=total
         )
         db.session.add(b)
+        bump_cache_version('bookings')
         db.session.commit()
 
         return render_template('confirm.html', category='Viaje Exclusivo', total=total, details={
@@ -753,10 +1638,19 @@ def anywhere():
                     form_data=request.form
                 )
 
-        # Calcular precio
-        total, km = obtener_precio_larga_distancia(
-            origin_city, origin_street, destination_city, destination_street, km_price
-        )
+        # Calcular precio (reusando la cotización firmada por /api/quote si coincide)
+        known = signed_quotes(request.form.getlist('quote_token'))
+        key = quote_key('precio_general', [origin_city, origin_street, destination_city, destination_street], km_price)
+        if key in known:
+            quote = known[key]
+        else:
+            quote = obtener_precio_larga_distancia(
+                origin_city, origin_street, destination_city, destination_street, km_price
+            )
+        if not quote or quote[0] is None:
+            flash('No se pudo calcular el precio en este momento. Intentá de nuevo en unos minutos.', 'error')
+            return render_template('anywhere.html', today=date.today().isoformat(), hour="00:00", form_data=request.form)
+        total, km = quote
 
         # Guardar reserva
         b = AnywhereBooking(
@@ -773,6 +1667,7 @@ def anywhere():
             total_price=total
         )
         db.session.add(b)
+        bump_cache_version('bookings')
         db.session.commit()
 
         return render_template('confirm.html', category='Viaje a cualquier destino', total=total, details={
@@ -796,6 +1691,127 @@ def anywhere():
 
     return render_template('anywhere.html', today=today.isoformat(), hour=hour_str, form_data={})
 
+@app.route('/api/quote', methods=['POST'])
+def api_quote():
+    """Cotiza mientras el usuario completa el formulario y calienta el cache.
+       type='city': {address} -> recargo por dirección en Córdoba (única ciudad que se cotiza).
+       type='anywhere': {origin, origin_street, destination, destination_street}.
+       Devuelve el precio y un token firmado que el formulario envía al confirmar.
+       Es público: se limita por IP y por largo de los campos.
+    """
+    if _quote_throttle.incr(request.remote_addr) > app.config['QUOTE_RATE_LIMIT']:
+        return jsonify(ok=False, error='Demasiadas cotizaciones, probá de nuevo en un minuto'), 429
+
+    data = request.get_json(silent=True) or request.form
+    km_price = price("KM_PRICE")
+    unavailable = (jsonify(ok=False, error='No se pudo cotizar en este momento'), 502)
+
+    def field(name):
+        value = data.get(name)
+        return value.strip() if isinstance(value, str) else ''
+
+    if data.get('type') == 'anywhere':
+        parts = [field(f) for f in ('origin', 'origin_street', 'destination', 'destination_street')]
+        if not all(parts):
+            return jsonify(ok=False, error='Faltan datos de origen o destino'), 400
+        if any(len(p) > QUOTE_MAX_FIELD_LENGTH for p in parts):
+            return jsonify(ok=False, error='Dirección demasiado larga'), 400
+        quote = obtener_precio_larga_distancia(*parts, km_price)
+        if quote is None or quote[0] is None:
+            return unavailable
+        amount, km = quote
+        token = sign_quote('precio_general', parts, km_price, list(quote))
+    else:
+        parts = ['cordoba', field('address')]
+        if not parts[1]:
+            return jsonify(ok=False, error='Falta la dirección'), 400
+        if len(parts[1]) > QUOTE_MAX_FIELD_LENGTH:
+            return jsonify(ok=False, error='Dirección demasiado larga'), 400
+        amount, km = obtener_precio(*parts, km_price), None
+        if amount is None:
+            return unavailable
+        token = sign_quote('precio', parts, km_price, amount)
+
+    db.session.commit()  # guarda la cotización que cached_quote dejó en la sesión
+    return jsonify(ok=True, price=amount, km=km, token=token)
+
+@app.route('/api/availability')
+def api_availability():
+    """Disponibilidad de viajes compartidos en JSON: ?route=RC-CBA&date=YYYY-MM-DD&p=2.
+       El ETag sale de las versiones de la ruta y del día, así que un
+       If-None-Match vigente se responde con 304 sin calcular los horarios.
+    """
+    route = request.args.get('route')
+    if route not in ROUTES:
+        return jsonify(ok=False, error='Ruta inválida'), 400
+    try:
+        on_date = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify(ok=False, error='Fecha inválida'), 400
+    try:
+        passengers = max(1, int(request.args.get('p', 1)))
+    except ValueError:
+        return jsonify(ok=False, error='Cantidad de pasajeros inválida'), 400
+
+    versions = cache_versions(*slots_version_keys(route, on_date))
+    # hoy la lista se achica a medida que pasan los horarios
+    clock = now_hhmm() if on_date == date.today() else ''
+    etag = hashlib.sha1(f"{route}|{on_date}|{passengers}|{versions}|{clock}".encode()).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        slots = [
+            {
+                'time': s.time,
+                'capacity': s.capacity,
+                'free': free,
+                'bookable': bookable,
+                'book_url': slot_url('shared_book', s, p=passengers),
+            }
+            for s, free, bookable in day_availability(route, on_date, passengers)
+        ]
+        response = jsonify(ok=True, route=route, date=on_date.isoformat(),
+                           passengers=passengers, slots=slots)
+    response.set_etag(etag)
+    # el proxy puede guardar la respuesta pero debe revalidar siempre
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+def calendar_args():
+    """Ruta, mes y pasajeros de /shared/calendar y /api/calendar."""
+    route = request.args.get('route')
+    if route not in ROUTES:
+        route = ROUTES[0]
+    this_month = date.today().replace(day=1)
+    month_start = max(parse_month(request.args.get('month')) or this_month, this_month)
+    try:
+        passengers = min(CAPACITY_PER_TRIP, max(1, int(request.args.get('p', 1))))
+    except ValueError:
+        passengers = 1
+    return route, month_start, passengers
+
+@app.route('/shared/calendar')
+def shared_calendar():
+    route, month_start, passengers = calendar_args()
+    times, days = month_occupancy(route, month_start, passengers)
+    this_month = date.today().replace(day=1)
+    prev_month = (month_start - dtime(days=1)).replace(day=1)
+    return render_template('shared_calendar.html', route=route, month_start=month_start,
+                           passengers=passengers, times=times, days=days,
+                           prev_month=prev_month if prev_month >= this_month else None,
+                           next_month=(month_start + dtime(days=31)).replace(day=1))
+
+@app.route('/api/calendar')
+def api_calendar():
+    """Ocupación del mes en JSON: ?route=RC-CBA&month=YYYY-MM&p=2."""
+    route, month_start, passengers = calendar_args()
+    times, days = month_occupancy(route, month_start, passengers)
+    return jsonify(ok=True, route=route, month=month_start.strftime('%Y-%m'),
+                   passengers=passengers, times=times,
+                   days=[{'date': d['date'].isoformat(), 'slots': d['cells']} for d in days])
+
 @app.route('/airport_shared', methods=['GET', 'POST'])
 def airport_shared():
     if request.method == 'POST':
@@ -808,19 +1824,7 @@ def airport_shared():
             flash('Fecha inválida', 'error')
             return redirect(url_for('shared'))
 
-        ensure_day_slots(route, on_date)
-        # List availability: si la fecha es hoy filtrar horarios pasados
-        if on_date == date.today():
-            now = now_hhmm()
-            schedules = TripSchedule.query.filter_by(route=route, date=on_date).filter(TripSchedule.time >= now).order_by(TripSchedule.time.asc()).all()
-        else:
-            schedules = TripSchedule.query.filter_by(route=route, date=on_date).order_by(TripSchedule.time.asc()).all()
-
-        availability = []
-        for s in schedules:
-            taken = booked_seats(s.id)
-            free = max(0, s.capacity - taken)
-            availability.append((s, free, free >= passengers))
+        availability = day_availability(route, on_date, passengers)
         return render_template('airport_slots.html', route=route, on_date=on_date, passengers=passengers, availability=availability)
 
     # GET inicial
@@ -846,15 +1850,15 @@ def admin_logout():
 @app.route('/admin')
 @login_required
 def admin_dashboard():
-    counts = {
-        'shared': SharedBooking.query.count(),
-        'parcels': ParcelBooking.query.count(),
-        'airport': AirportExclusive.query.count(),
-        'exclusive': CityExclusive.query.count(),
-        'anywhere': AnywhereBooking.query.count(),
-        'schedules': TripSchedule.query.count(),
-    }
-    return render_template('admin_dashboard.html', counts=counts)
+    return render_template('admin_dashboard.html', stats=dashboard_stats(), labels=BOOKING_LABELS)
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Latencia y SQL por endpoint y latencia de las APIs de precios, en formato Prometheus."""
+    token_ok = METRICS_TOKEN and request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}'
+    if not (token_ok or session.get('admin')):
+        return redirect(url_for('admin_login'))
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/admin/prices', methods=['GET', 'POST'])
 @login_required
@@ -868,10 +1872,13 @@ def admin_prices():
                 except:
                     continue
                 pc = PriceConfig.query.get(k)
+                if k == 'KM_PRICE' and (not pc or pc.value != v):
+                    drop_quote_cache(v)
                 if pc:
                     pc.value = v
                 else:
                     db.session.add(PriceConfig(key=k, value=v))
+        bump_cache_version('prices')
         db.session.commit()
         flash('Precios actualizados', 'success')
         return redirect(url_for('admin_prices'))
@@ -927,18 +1934,15 @@ def admin_schedules():
                     capacity=cap
                 )
                 db.session.add(new_template)
+                bump_slots_version(route)
                 db.session.commit() # Guarda la plantilla
                 flash(f'Nueva plantilla recurrente creada para los {on_date.strftime("%A")}s.', 'success')
                 
-                # --- ¡AQUÍ ESTÁ LA CORRECCIÓN! ---
-                # Ahora, rellenamos los próximos 366 días
-                print(f"Rellenando {day_of_week}s (weekday) para {route} a las {time_str}...")
-                for i in range(366): 
-                    check_date = today + dtime(days=i)
-                    if check_date.weekday() == day_of_week:
-                        # ensure_day_slots es inteligente y no duplica
-                        ensure_day_slots(route, check_date)
-                # --- FIN DE LA CORRECCIÓN ---
+                # Con horarios virtuales la plantilla ya aparece sola; si no,
+                # rellenamos los próximos 366 días en un único INSERT
+                if not app.config['VIRTUAL_SLOTS']:
+                    created = materialize_slots(today, today + dtime(days=365), route, new_template.id)
+                    print(f"Rellenados {created} horarios para {route} a las {time_str}.")
             
             # Redirigimos con 'no_ensure' para evitar el bug de re-creación
             return redirect(url_for('admin_schedules', no_ensure=1))
@@ -948,6 +1952,7 @@ def admin_schedules():
             exists = TripSchedule.query.filter_by(route=route, date=on_date, time=time_str).first()
             if exists:
                 exists.capacity = cap
+                exists.manual = True
                 flash('Horario actualizado.', 'success')
             else:
                 db.session.add(TripSchedule(
@@ -955,24 +1960,34 @@ def admin_schedules():
                     date=on_date, 
                     time=time_str, 
                     capacity=cap,
-                    created_from_recurring_id=None
+                    created_from_recurring_id=None,
+                    manual=True
                 ))
                 flash('Horario agregado para la fecha indicada.', 'success')
+            bump_slots_version(route, on_date)
             db.session.commit()
             # Redirigimos con 'no_ensure' para evitar el bug de re-creación
             return redirect(url_for('admin_schedules', no_ensure=1))
 
-    # --- LÓGICA GET (Sin cambios) ---
-    if not request.args.get('no_ensure'):
-        for i in range(0, 7):
-            d = today + dtime(days=i)
-            ensure_day_slots('RC-CBA', d)
-            ensure_day_slots('CBA-RC', d)
+    # --- LÓGICA GET: una ventana de fechas (por defecto la semana desde hoy) ---
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start = today
+    start = max(start, today)
+    end = start + dtime(days=SCHEDULES_WINDOW_DAYS - 1)
+
+    if not app.config['VIRTUAL_SLOTS'] and not request.args.get('no_ensure'):
+        materialize_slots(start, end)
 
+    # Horarios de la ventana (con los de plantilla aún sin fila si son virtuales)
     now = datetime.now().strftime('%H:%M')
-    scheds = TripSchedule.query.filter(
-        (TripSchedule.date > today) | ((TripSchedule.date == today) & (TripSchedule.time >= now))
-    ).order_by(TripSchedule.date.asc(), TripSchedule.route.asc(), TripSchedule.time.asc()).all()
+    scheds = [s for s in expand_slots(start, end) if s.date > today or (s.date == today and s.time >= now)]
+    if not app.config['VIRTUAL_SLOTS']:
+        scheds = [s for s in scheds if s.id is not None]
+
+    # Ocupación ya calculada: el template no consulta la BD por cada fila
+    occupancy = {s.id: s.seats_taken for s in scheds if s.id is not None}
 
     from collections import OrderedDict
     grouped = []
@@ -987,52 +2002,82 @@ def admin_schedules():
     for g in grouped:
         g['routes'] = [{'route': r, 'schedules': sl} for r, sl in g['routes'].items()]
 
-    return render_template('admin_schedules.html', grouped_schedules=grouped, booked_seats=booked_seats)
+    return render_template('admin_schedules.html', grouped_schedules=grouped, occupancy=occupancy,
+                           window_start=start, window_end=end,
+                           prev_start=max(today, start - dtime(days=SCHEDULES_WINDOW_DAYS)) if start > today else None,
+                           next_start=end + dtime(days=1))
 
 @app.route('/admin/bookings')
 @login_required
 def admin_bookings():
-    # 1. Leemos ambos parámetros de la URL. Si no existen, usamos 'all'.
+    # 1. Tipo de reserva (pestaña) y filtros. Si no existen, usamos 'shared' y 'all'.
+    btype = request.args.get('type', 'shared')
+    if btype not in BOOKING_MODELS:
+        btype = 'shared'
     filter_by_date = request.args.get('filter', 'all')
     filter_by_route = request.args.get('route', 'all')
+    # ?archive=1 consulta los viajes ya archivados con `flask archive`
+    archived = request.args.get('archive') == '1'
 
-    # 2. Iniciamos la consulta base uniendo las tablas necesarias
-    query = SharedBooking.query.join(TripSchedule, SharedBooking.schedule)
-    
-    # 3. Aplicamos el filtro de FECHA si es necesario
-    today = date.today()
-    if filter_by_date == 'day':
-        query = query.filter(TripSchedule.date == today)
-    elif filter_by_date == 'week':
-        start_of_week = today - dtime(days=today.weekday())
-        end_of_week = start_of_week + dtime(days=6)
-        query = query.filter(TripSchedule.date.between(start_of_week, end_of_week))
+    # 2. Una página de esa pestaña, sólo con las columnas que muestra la tabla
+    query = booking_query(btype, filter_by_date, filter_by_route, archived)
+    rows, next_cursor = keyset_page(query, booking_source(btype, archived), request.args.get('cursor'))
 
-    # 4. Aplicamos el filtro de RUTA si es necesario
-    if filter_by_route in ['RC-CBA', 'CBA-RC']:
-        query = query.filter(TripSchedule.route == filter_by_route)
-
-    # 5. Finalmente, ordenamos y ejecutamos la consulta
-    shared = query.order_by(SharedBooking.created_at.desc()).all()
-    
-    # Las otras reservas no cambian por ahora
-    parcels = ParcelBooking.query.order_by(ParcelBooking.created_at.desc()).all()
-    airport = AirportExclusive.query.order_by(AirportExclusive.created_at.desc()).all()
-    exclusive = CityExclusive.query.order_by(CityExclusive.created_at.desc()).all()
-    anywhere = AnywhereBooking.query.order_by(AnywhereBooking.created_at.desc()).all()
-    
-    # 6. Pasamos AMBOS filtros activos al template
     return render_template(
-        'admin_bookings.html', 
-        shared=shared, 
-        parcels=parcels, 
-        airport=airport, 
-        exclusive=exclusive, 
-        anywhere=anywhere,
+        'admin_bookings.html',
+        btype=btype,
+        rows=rows,
+        next_cursor=next_cursor,
+        is_first_page=not request.args.get('cursor'),
+        labels=BOOKING_LABELS,
+        archived=archived,
+        has_route=booking_column(btype, 'route') is not None,
         current_date_filter=filter_by_date,
         current_route_filter=filter_by_route
     )
 
+@app.route('/admin/export/<btype>.<any(csv, ndjson):fmt>')
+@login_required
+def admin_export_bookings(btype, fmt):
+    """Exporta un tipo de reserva con los mismos filtros que /admin/bookings
+       (filter, route, archive). La respuesta se genera fila a fila sobre un
+       cursor del servidor (yield_per), así que un año entero usa memoria constante.
+    """
+    if btype not in BOOKING_MODELS:
+        abort(404)
+    archived = request.args.get('archive') == '1'
+    source = booking_source(btype, archived)
+    query = booking_query(btype, request.args.get('filter', 'all'), request.args.get('route', 'all'), archived) \
+        .order_by(source.created_at, source.id).yield_per(EXPORT_BATCH_SIZE)
+    columns = BOOKING_COLUMNS[btype]
+
+    def as_text(value):
+        return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in query:
+            writer.writerow([as_text(v) for v in row])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def generate_ndjson():
+        for row in query:
+            yield json.dumps({c: as_text(v) for c, v in zip(columns, row)}, ensure_ascii=False) + '\n'
+
+    if fmt == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+    filename = f"reservas-{btype}{'-archivo' if archived else ''}-{date.today().isoformat()}.{fmt}"
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/admin/delete_booking', methods=['POST'])
 @login_required
 def admin_delete_booking():
@@ -1042,58 +2087,89 @@ def admin_delete_booking():
         flash('Parámetros inválidos', 'error')
         return redirect(url_for('admin_bookings'))
 
-    mapping = {
-        'shared': SharedBooking,
-        'parcels': ParcelBooking,
-        'airport': AirportExclusive,
-        'exclusive': CityExclusive,
-        'anywhere': AnywhereBooking
-    }
-
-    Model = mapping.get(btype)
+    Model = BOOKING_MODELS.get(btype)
     if not Model:
         flash('Tipo de reserva inválido', 'error')
         return redirect(url_for('admin_bookings'))
 
-    obj = Model.query.get(bid)
-    if not obj:
-        flash('Reserva no encontrada', 'error')
-        return redirect(url_for('admin_bookings'))
-
     try:
-        db.session.delete(obj)
+        if not delete_bookings(btype, [int(bid)]):
+            flash('Reserva no encontrada', 'error')
+            return redirect(url_for('admin_bookings', type=btype))
         db.session.commit()
         flash('Reserva eliminada', 'success')
     except Exception as e:
         db.session.rollback()
         flash('Error al eliminar la reserva', 'error')
 
-    return redirect(url_for('admin_bookings'))
+    return redirect(url_for('admin_bookings', type=btype))
+
+@app.route('/admin/bulk_delete_bookings', methods=['POST'])
+@login_required
+def admin_bulk_delete_bookings():
+    """Borra en una sola transacción las reservas tildadas de un tipo."""
+    btype = request.form.get('type')
+    if btype not in BOOKING_MODELS:
+        flash('Tipo de reserva inválido', 'error')
+        return redirect(url_for('admin_bookings'))
+    try:
+        ids = [int(i) for i in request.form.getlist('ids')]
+    except ValueError:
+        flash('Parámetros inválidos', 'error')
+        return redirect(url_for('admin_bookings', type=btype))
+    if not ids:
+        flash('No se seleccionó ninguna reserva', 'error')
+        return redirect(url_for('admin_bookings', type=btype))
+
+    try:
+        deleted = delete_bookings(btype, ids)
+        db.session.commit()
+        flash(f'{deleted} reserva(s) eliminada(s)', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('Error al eliminar las reservas', 'error')
+
+    return redirect(url_for('admin_bookings', type=btype))
 
 @app.route('/admin/delete_schedule', methods=['POST'])
 @login_required
 def admin_delete_schedule():
     sched_id = request.form.get('id')
     if not sched_id:
-        flash('ID de horario inválido', 'error')
-        return redirect(url_for('admin_schedules'))
+        # Horario de plantilla sin fila: se identifica por ruta, fecha y hora
+        slot = parse_slot_key(request.form.get('slot'))
+        if not slot:
+            flash('ID de horario inválido', 'error')
+            return redirect(url_for('admin_schedules'))
+        try:
+            deleted, _ = delete_schedules([], [slot])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error al eliminar horario: {str(e)}', 'error')
+            return redirect(url_for('admin_schedules', no_ensure=1))
+        if deleted:
+            flash('Horario eliminado correctamente', 'success')
+        else:
+            flash('Horario no encontrado', 'error')
+        return redirect(url_for('admin_schedules', no_ensure=1))
 
     try:
-        # Usamos get_or_404 para simplificar
-        sched = TripSchedule.query.get_or_404(int(sched_id))
+        sched = db.session.query(TripSchedule.id, TripSchedule.date, TripSchedule.time) \
+            .filter(TripSchedule.id == int(sched_id)).one()
     except Exception:
         flash('Horario no encontrado', 'error')
         return redirect(url_for('admin_schedules'))
         
     # --- VERIFICACIÓN CLAVE ---
-    # Comprobamos si hay reservas para este viaje
-    if len(sched.bookings) > 0:
+    # EXISTS sobre las reservas del viaje, sin cargarlas
+    if db.session.query(db.exists().where(SharedBooking.schedule_id == sched.id)).scalar():
         flash(f'No se puede eliminar. El viaje del {sched.date.strftime("%d/%m")} a las {sched.time} ya tiene reservas.', 'error')
         return redirect(url_for('admin_schedules'))
     # --- FIN DE VERIFICACIÓN ---
 
     try:
-        db.session.delete(sched)
+        delete_schedules([sched.id])
         db.session.commit()
         flash('Horario eliminado correctamente', 'success')
     except Exception as e:
@@ -1103,6 +2179,37 @@ def admin_delete_schedule():
 
     return redirect(url_for('admin_schedules', no_ensure=1))
 
+@app.route('/admin/bulk_delete_schedules', methods=['POST'])
+@login_required
+def admin_bulk_delete_schedules():
+    """Borra en una sola transacción los horarios tildados (con fila o de
+       plantilla); los que tienen reservas se saltean y se informan.
+    """
+    try:
+        ids = [int(i) for i in request.form.getlist('ids')]
+    except ValueError:
+        flash('Parámetros inválidos', 'error')
+        return redirect(url_for('admin_schedules'))
+    slots = [parse_slot_key(key) for key in request.form.getlist('slots')]
+    if not all(slots):
+        flash('Parámetros inválidos', 'error')
+        return redirect(url_for('admin_schedules'))
+    if not ids and not slots:
+        flash('No se seleccionó ningún horario', 'error')
+        return redirect(url_for('admin_schedules'))
+
+    try:
+        deleted, with_bookings = delete_schedules(ids, slots)
+        db.session.commit()
+        flash(f'{deleted} horario(s) eliminado(s).', 'success')
+        if with_bookings:
+            flash(f'{with_bookings} horario(s) no se eliminaron porque tienen reservas.', 'error')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al eliminar horarios: {str(e)}', 'error')
+
+    return redirect(url_for('admin_schedules', no_ensure=1, start=request.form.get('start') or None))
+
 @app.route('/admin/delete_recurring_schedule', methods=['POST'])
 @login_required
 def admin_delete_recurring_schedule():
@@ -1110,25 +2217,31 @@ def admin_delete_recurring_schedule():
     template = RecurringSchedule.query.get_or_404(template_id)
     
     today = date.today()
-    future_trips = TripSchedule.query.filter(
-        TripSchedule.created_from_recurring_id == template.id,
-        TripSchedule.date >= today
-    ).all()
-
-    # 1. Revisar si alguno tiene reservas
-    for trip in future_trips:
-        if len(trip.bookings) > 0:
-            flash(f'No se puede eliminar. El viaje recurrente del {trip.date.strftime("%d/%m")} a las {trip.time} tiene reservas.', 'error')
-            
-            return redirect(url_for('admin_schedules'))
+    future = (TripSchedule.created_from_recurring_id == template.id, TripSchedule.date >= today)
+
+    # 1. Revisar si alguno tiene reservas: una consulta que trae sólo el primero
+    booked = db.session.query(TripSchedule.date, TripSchedule.time) \
+        .filter(*future, db.exists().where(SharedBooking.schedule_id == TripSchedule.id)) \
+        .order_by(TripSchedule.date, TripSchedule.time).first()
+    if booked:
+        flash(f'No se puede eliminar. El viaje recurrente del {booked.date.strftime("%d/%m")} a las {booked.time} tiene reservas.', 'error')
+        return redirect(url_for('admin_schedules'))
             
     try:
-        # 2. Si no hay reservas, borrar los viajes futuros
-        for trip in future_trips:
-            db.session.delete(trip)
+        # 2. Si no hay reservas, borrar los viajes futuros con un solo DELETE
+        db.session.execute(db.delete(TripSchedule).where(*future),
+                           execution_options={'synchronize_session': False})
+
+        # Los viajes pasados se conservan, pero ya sin plantilla
+        db.session.execute(
+            db.update(TripSchedule).where(TripSchedule.created_from_recurring_id == template.id)
+            .values(created_from_recurring_id=None),
+            execution_options={'synchronize_session': False}
+        )
             
         # 3. Borrar la plantilla
         db.session.delete(template)
+        bump_slots_version(template.route)
         
         db.session.commit()
         flash('Plantilla recurrente y todos sus viajes futuros (sin reservas) eliminados.', 'success')
@@ -1139,48 +2252,304 @@ def admin_delete_recurring_schedule():
     return redirect(url_for('admin_schedules', no_ensure=1))
 
 
-def backfill_recurring_links():
+def weekday_of(column):
+    """Día de la semana de una columna fecha en SQL, como date.weekday() (0=Lunes)."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # strftime('%w') cuenta desde el domingo
+        return (db.cast(db.func.strftime('%w', column), db.Integer) + 6) % 7
+    if dialect == 'postgresql':
+        return db.cast(db.extract('isodow', column), db.Integer) - 1
+    if dialect in ('mysql', 'mariadb'):
+        return db.func.weekday(column)
+    # Sin una función de día de semana conocida no se puede cruzar viajes con plantillas
+    raise RuntimeError(
+        f"El motor '{dialect}' no tiene un día de la semana soportado para cruzar viajes "
+        "con plantillas (backfill-links, cleanup-slots, migrate-bookings, borrar horarios). "
+        "Motores soportados: sqlite, postgresql, mysql/mariadb."
+    )
+
+def template_exists():
+    """EXISTS: hay una plantilla con la ruta, hora y día de semana del TripSchedule."""
+    return db.exists().where(
+        RecurringSchedule.route == TripSchedule.route,
+        RecurringSchedule.time == TripSchedule.time,
+        RecurringSchedule.day_of_week == weekday_of(TripSchedule.date),
+    )
+
+def backfill_recurring_links(chunk_size=1000, after_id=0):
     """
     Actualiza los TripSchedule antiguos (sin ID recurrente) para vincularlos
     a las plantillas de RecurringSchedule recién creadas.
+    Recorre los viajes por id en tandas de `chunk_size` y en cada tanda el cruce
+    con la plantilla lo hace un UPDATE correlacionado; hay commit por tanda.
+    Es idempotente: sólo toca viajes sin vínculo, así que se puede cortar y
+    volver a correr (con `after_id` se retoma desde el último id informado).
+    Devuelve la cantidad de viajes vinculados.
     """
     print("Iniciando backfill de IDs recurrentes...")
-    
-    # 1. Traer todas las plantillas a memoria para búsquedas rápidas
-    templates = RecurringSchedule.query.all()
-    template_map = {} # { (route, day_of_week, time): template_id }
-    for t in templates:
-        template_map[(t.route, t.day_of_week, t.time)] = t.id
-    
-    print(f"Mapa de {len(template_map)} plantillas recurrentes creado.")
 
-    # 2. Buscar todos los viajes que NO tienen un ID recurrente
-    trips_to_update = TripSchedule.query.filter_by(created_from_recurring_id=None).all()
-    
-    print(f"Se encontraron {len(trips_to_update)} viajes para actualizar.")
-    
-    updated_count = 0
-    # 3. Iterar y vincular
-    for trip in trips_to_update:
-        day_num = trip.date.weekday()
-        key = (trip.route, day_num, trip.time)
-        
-        # Buscar en el mapa si existe una plantilla que coincida
-        matching_id = template_map.get(key)
-        
-        if matching_id:
-            trip.created_from_recurring_id = matching_id
-            updated_count += 1
-            
-    if updated_count > 0:
+    unlinked = TripSchedule.created_from_recurring_id.is_(None)
+    pending = TripSchedule.query.filter(unlinked, TripSchedule.id > after_id).count()
+    print(f"Se encontraron {pending} viajes sin plantilla (id > {after_id}).")
+
+    # La plantilla que corresponde a cada viaje: misma ruta, hora y día de semana
+    match = db.select(RecurringSchedule.id).where(
+        RecurringSchedule.route == TripSchedule.route,
+        RecurringSchedule.time == TripSchedule.time,
+        RecurringSchedule.day_of_week == weekday_of(TripSchedule.date),
+    ).limit(1).scalar_subquery()
+
+    updated_count = scanned = 0
+    last_id = after_id
+    while True:
+        ids = db.session.execute(
+            db.select(TripSchedule.id).where(unlinked, TripSchedule.id > last_id)
+            .order_by(TripSchedule.id).limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            break
         try:
+            result = db.session.execute(
+                db.update(TripSchedule)
+                .where(unlinked, TripSchedule.id.between(ids[0], ids[-1]), match.isnot(None))
+                .values(created_from_recurring_id=match),
+                execution_options={'synchronize_session': False}
+            )
             db.session.commit()
-            print(f"¡Éxito! {updated_count} viajes han sido vinculados.")
         except Exception as e:
             db.session.rollback()
-            print(f"Error al hacer commit de los vínculos: {e}")
+            print(f"Error al vincular los viajes {ids[0]}-{ids[-1]}: {e}")
+            print(f"Para retomar: flask backfill-links --after-id {last_id}")
+            raise
+        updated_count += result.rowcount
+        scanned += len(ids)
+        last_id = ids[-1]
+        print(f"  {scanned}/{pending} revisados, {updated_count} vinculados (último id {last_id})")
+
+    if updated_count > 0:
+        print(f"¡Éxito! {updated_count} viajes han sido vinculados.")
     else:
         print("No se necesitaron actualizaciones (o no se encontraron coincidencias).")
+    return updated_count
+
+def cleanup_orphan_slots(days=60, dry_run=False, chunk_size=500):
+    """
+    Borra los TripSchedule de los próximos `days` días que no corresponden a
+    ninguna plantilla de RecurringSchedule (misma ruta, hora y día de semana)
+    y no tienen reservas. Los candidatos salen de un anti-join (NOT EXISTS) y
+    se borran por tandas con commit por tanda, para no frenar las reservas.
+    Los horarios cargados a mano desde el admin (manual) nunca son candidatos.
+    Devuelve la cantidad de horarios borrados (o a borrar, con dry_run).
+    """
+    today = date.today()
+    end = today + dtime(days=days)
+
+    has_bookings = db.exists().where(SharedBooking.schedule_id == TripSchedule.id)
+    orphan = (TripSchedule.date.between(today, end), TripSchedule.manual.is_(False), ~template_exists())
+
+    kept = db.session.query(TripSchedule.id, TripSchedule.date, TripSchedule.route, TripSchedule.time,
+                            db.func.count(SharedBooking.id)) \
+        .join(SharedBooking, SharedBooking.schedule_id == TripSchedule.id) \
+        .filter(*orphan).group_by(TripSchedule.id).order_by(TripSchedule.date, TripSchedule.time).all()
+    for sid, on_date, route, t, n in kept:
+        print(f"KEEP (has bookings): {sid} {on_date} {route} {t} bookings={n}")
+
+    deleted = 0
+    last_id = 0
+    while True:
+        chunk = db.session.query(TripSchedule.id, TripSchedule.date, TripSchedule.route, TripSchedule.time) \
+            .filter(*orphan, ~has_bookings, TripSchedule.id > last_id) \
+            .order_by(TripSchedule.id).limit(chunk_size).all()
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        if dry_run:
+            for sid, on_date, route, t in chunk:
+                print(f"MARK DELETE: {sid} {on_date} {route} {t}")
+            deleted += len(chunk)
+            continue
+        # NOT EXISTS otra vez en el DELETE: si entró una reserva entre medio, se conserva
+        result = db.session.execute(
+            db.delete(TripSchedule)
+            .where(TripSchedule.id.in_([c.id for c in chunk]), ~has_bookings),
+            execution_options={'synchronize_session': False}
+        )
+        for route, on_date in {(c.route, c.date) for c in chunk}:
+            bump_slots_version(route, on_date)
+        db.session.commit()
+        deleted += result.rowcount
+        print(f"  {deleted} horarios eliminados (último id {last_id})")
+
+    print(f"\nHorarios huérfanos {'a borrar' if dry_run else 'eliminados'}: {deleted} (rango: {today} -> {end})")
+    if dry_run:
+        print("--dry-run: no se borró nada.")
+    return deleted
+
+def hhmm_minutes(t):
+    return int(t[:2]) * 60 + int(t[3:5])
+
+def migrate_bookings_to_slots(since=None, dry_run=False, batch_size=500):
+    """
+    Reasigna las reservas compartidas cuyo horario ya no coincide con ninguna
+    plantilla al horario de plantilla más cercano del mismo día y ruta.
+    - una consulta trae las reservas afectadas junto con su horario;
+    - el índice (ruta, fecha) -> [(minutos, hora, capacidad)] sale de RecurringSchedule;
+    - los horarios destino se crean de una vez y se cargan en una consulta;
+    - antes de mover a alguien se verifica el cupo del destino;
+    - los cambios se aplican con UPDATE por tandas (executemany) y un solo commit.
+    Devuelve (movidas, [casos a revisar]).
+    """
+    since = since or date.today()
+
+    # Reservas sin horario: no hay forma de saber a dónde iban
+    failed = [("orphan", bid, sid) for bid, sid in
+              db.session.query(SharedBooking.id, SharedBooking.schedule_id)
+              .outerjoin(TripSchedule, SharedBooking.schedule_id == TripSchedule.id)
+              .filter(TripSchedule.id.is_(None)).order_by(SharedBooking.id).all()]
+
+    affected = db.session.query(
+        SharedBooking.id, SharedBooking.passengers,
+        TripSchedule.id.label('schedule_id'), TripSchedule.route, TripSchedule.date, TripSchedule.time
+    ).join(TripSchedule, SharedBooking.schedule_id == TripSchedule.id) \
+     .filter(TripSchedule.date >= since, ~template_exists()) \
+     .order_by(SharedBooking.id).all()
+
+    slots_by_day = defaultdict(list)  # (ruta, día de semana) -> [(minutos, hora, capacidad, plantilla)]
+    for t in RecurringSchedule.query.all():
+        slots_by_day[(t.route, t.day_of_week)].append((hhmm_minutes(t.time), t.time, t.capacity, t.id))
+
+    def nearest_slot(route, on_date, old_time):
+        slots = slots_by_day.get((route, on_date.weekday()))
+        if not slots:
+            return None
+        old_mm = hhmm_minutes(old_time)
+        return min(slots, key=lambda s: abs(s[0] - old_mm))
+
+    plan = []
+    for b in affected:
+        target = nearest_slot(b.route, b.date, b.time)
+        if not target:
+            failed.append(("no_slots", b.id, b.route, b.date, b.time))
+        else:
+            plan.append((b, target))
+
+    # Horarios destino: crear los que falten y traerlos todos en una consulta
+    targets = {(b.route, b.date, t[1]): (t[2], t[3]) for b, t in plan}
+    if targets and not dry_run:
+        db.session.execute(insert_ignore(TripSchedule), [
+            {'route': r, 'date': d, 'time': t, 'capacity': cap, 'seats_taken': 0,
+             'created_from_recurring_id': template_id}
+            for (r, d, t), (cap, template_id) in targets.items()
+        ])
+    existing = {}
+    if targets:
+        dates = {d for _, d, _ in targets}
+        for s in db.session.query(TripSchedule.id, TripSchedule.route, TripSchedule.date, TripSchedule.time,
+                                  TripSchedule.capacity, TripSchedule.seats_taken) \
+                .filter(TripSchedule.date.in_(dates)):
+            if (s.route, s.date, s.time) in targets:
+                existing[(s.route, s.date, s.time)] = s
+
+    # Cupo en memoria: capacidad y ocupados de cada destino a medida que se llenan
+    room = {key: (s.capacity - s.seats_taken) for key, s in existing.items()}
+    moved, moves, released, taken = 0, [], defaultdict(int), defaultdict(int)
+    for b, (_, t, cap, _) in plan:
+        key = (b.route, b.date, t)
+        free = room.get(key, cap)
+        if b.passengers > free:
+            failed.append(("no_capacity", b.id, b.route, b.date, b.time, t))
+            continue
+        room[key] = free - b.passengers
+        moved += 1
+        print(f"MOVE: reserva {b.id} {b.route} {b.date} {b.time} -> {t} ({b.passengers} pax)")
+        if key in existing:  # con dry_run el destino puede no existir todavía
+            target_id = existing[key].id
+            moves.append({'bid': b.id, 'sid': target_id})
+            released[b.schedule_id] += b.passengers
+            taken[target_id] += b.passengers
+
+    if not dry_run and moves:
+        bookings = SharedBooking.__table__
+        trips = TripSchedule.__table__
+        move_booking = bookings.update().where(bookings.c.id == db.bindparam('bid')) \
+            .values(schedule_id=db.bindparam('sid'))
+        add_seats = trips.update().where(trips.c.id == db.bindparam('sid')) \
+            .values(seats_taken=trips.c.seats_taken + db.bindparam('n'))
+        for i in range(0, len(moves), batch_size):
+            db.session.execute(move_booking, moves[i:i + batch_size])
+        release_seats(released)
+        db.session.execute(add_seats, [{'sid': sid, 'n': n} for sid, n in taken.items()])
+        for route, on_date in {(b.route, b.date) for b, _ in plan}:
+            bump_slots_version(route, on_date)
+        bump_cache_version('bookings')
+    db.session.commit()
+    return moved, failed
+
+def archive_rows(kind, ids):
+    """Copia las filas `ids` de un tipo ('trips' o un tipo de reserva) a su tabla
+       de archivo y las borra de la tabla viva. No hace commit.
+    """
+    archive = ARCHIVE_TABLES[kind]
+    live = booking_source(kind).__table__
+    names = [c.name for c in archive.columns]
+    db.session.execute(archive.insert().from_select(
+        names, db.select(*[live.c[n] for n in names]).where(live.c.id.in_(ids))
+    ))
+    db.session.execute(live.delete().where(live.c.id.in_(ids)))
+
+def archive_before(before, chunk_size=500):
+    """
+    Pasa a las tablas de archivo los viajes con fecha anterior a `before` junto
+    con sus reservas compartidas, y las demás reservas con fecha anterior.
+    Trabaja por tandas de `chunk_size` filas con una transacción por tanda, así
+    que se puede cortar y volver a correr. Devuelve {tipo: filas archivadas}.
+    """
+    moved = defaultdict(int)
+
+    def chunks(Model, *criteria):
+        while True:
+            ids = db.session.execute(
+                db.select(Model.id).where(*criteria).order_by(Model.id).limit(chunk_size)
+            ).scalars().all()
+            if not ids:
+                return
+            yield ids
+
+    # Viajes compartidos: las reservas viajan con su horario
+    for trip_ids in chunks(TripSchedule, TripSchedule.date < before):
+        booking_ids = db.session.execute(
+            db.select(SharedBooking.id).where(SharedBooking.schedule_id.in_(trip_ids))
+        ).scalars().all()
+        try:
+            for i in range(0, len(booking_ids), chunk_size):
+                archive_rows('shared', booking_ids[i:i + chunk_size])
+            archive_rows('trips', trip_ids)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        moved['trips'] += len(trip_ids)
+        moved['shared'] += len(booking_ids)
+        print(f"  viajes: {moved['trips']} archivados ({moved['shared']} reservas)")
+
+    for btype, Model in BOOKING_MODELS.items():
+        if btype == 'shared':
+            continue
+        for ids in chunks(Model, Model.date < before):
+            try:
+                archive_rows(btype, ids)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            moved[btype] += len(ids)
+            print(f"  {BOOKING_LABELS[btype]}: {moved[btype]} archivadas")
+
+    if moved:
+        bump_cache_version('bookings')
+        db.session.commit()
+    return dict(moved)
 
 # CLI init
 @app.cli.command('initdb')
@@ -1190,11 +2559,53 @@ def initdb():
     seed_recurring_schedules() # Añade esta línea
     print('DB initialized, prices seeded, and recurring schedules seeded.')
 
+@app.cli.command('materialize-slots')
+@click.option('--days', type=click.IntRange(1), default=60, show_default=True, help='Días hacia adelante desde hoy.')
+@click.option('--route', type=click.Choice(ROUTES), default=None, help='Sólo esta ruta.')
+def materialize_slots_command(days, route):
+    """Crea las filas de TripSchedule que faltan según las plantillas."""
+    today = date.today()
+    created = materialize_slots(today, today + dtime(days=days - 1), route)
+    print(f"{created} horarios creados ({today} -> {today + dtime(days=days - 1)}).")
+
 @app.cli.command('backfill-links')
-def backfill_links_command():
+@click.option('--chunk-size', type=click.IntRange(1), default=1000, show_default=True, help='Viajes por tanda (un commit por tanda).')
+@click.option('--after-id', type=click.IntRange(0), default=0, show_default=True, help='Retomar desde este id de TripSchedule.')
+def backfill_links_command(chunk_size, after_id):
     """Vincula TripSchedules existentes a sus plantillas recurrentes."""
-    with app.app_context():
-        backfill_recurring_links()
+    backfill_recurring_links(chunk_size, after_id)
+
+@app.cli.command('cleanup-slots')
+@click.option('--days', type=click.IntRange(0), default=60, show_default=True, help='Días hacia adelante desde hoy a revisar.')
+@click.option('--dry-run', is_flag=True, help='Sólo listar lo que se borraría.')
+@click.option('--chunk-size', type=click.IntRange(1), default=500, show_default=True, help='Horarios por tanda (un commit por tanda).')
+def cleanup_slots_command(days, dry_run, chunk_size):
+    """Borra horarios sin plantilla recurrente y sin reservas (salvo los cargados a mano)."""
+    cleanup_orphan_slots(days, dry_run, chunk_size)
+
+@app.cli.command('migrate-bookings')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Sólo viajes desde esta fecha (por defecto hoy).')
+@click.option('--dry-run', is_flag=True, help='Sólo listar los movimientos.')
+@click.option('--batch-size', type=click.IntRange(1), default=500, show_default=True, help='Reservas por UPDATE.')
+def migrate_bookings_command(since, dry_run, batch_size):
+    """Mueve reservas de horarios sin plantilla al horario de plantilla más cercano."""
+    moved, failed = migrate_bookings_to_slots(since.date() if since else None, dry_run, batch_size)
+    print(f"Reservas {'a reasignar' if dry_run else 'reasignadas'}: {moved}")
+    if failed:
+        print("Revisar manualmente los siguientes casos:")
+        for f in failed:
+            print(f)
+
+@app.cli.command('archive')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), required=True, help='Archivar lo anterior a esta fecha (YYYY-MM-DD).')
+@click.option('--chunk-size', type=click.IntRange(1), default=500, show_default=True, help='Filas por transacción.')
+def archive_command(before, chunk_size):
+    """Mueve viajes pasados y sus reservas a las tablas de archivo."""
+    before = before.date()
+    if before > date.today():
+        raise click.BadParameter('sólo se pueden archivar fechas pasadas', param_hint='--before')
+    moved = archive_before(before, chunk_size)
+    print(f"Archivado antes de {before}: " + (', '.join(f'{k}={v}' for k, v in moved.items()) or 'nada'))
 
 if __name__ == '__main__':
     with app.app_context():
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""Banco de pruebas de carga local.
+
+Levanta la app con gunicorn (varios workers) sobre una base SQLite temporal
+recién sembrada, reemplaza la API de precios por un stub local con latencia
+configurable y corre escenarios concurrentes (búsquedas de disponibilidad,
+reservas que compiten por los últimos asientos y páginas del admin).
+Uso: python -m bench --workers 4 --users 16 --duration 15
+"""
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+import click
+
+from bench.pricing_stub import start_pricing_stub
+from bench.scenarios import admin_scenario, availability_scenario, booking_race_scenario
+from bench.server import AppServer, app_env, seed_database
+
+SCENARIOS = ('availability', 'booking', 'admin')
+COLUMNS = ('scenario', 'requests', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate',
+           'rejected', 'booked_seats', 'oversold', 'seat_drift')
+
+
+def print_table(reports):
+    widths = {c: max(len(c), *(len(str(r.get(c, '-'))) for r in reports)) for c in COLUMNS}
+    print('  '.join(c.ljust(widths[c]) for c in COLUMNS))
+    for r in reports:
+        print('  '.join(str(r.get(c, '-')).ljust(widths[c]) for c in COLUMNS))
+
+
+@click.command()
+@click.option('--workers', type=click.IntRange(1), default=4, show_default=True, help='Workers de gunicorn.')
+@click.option('--threads', type=click.IntRange(1), default=1, show_default=True, help='Threads por worker.')
+@click.option('--users', type=click.IntRange(1), default=16, show_default=True, help='Usuarios concurrentes.')
+@click.option('--duration', type=click.FloatRange(1), default=15, show_default=True, help='Segundos por escenario.')
+@click.option('--pricing-latency', type=click.FloatRange(0), default=0.15, show_default=True,
+              help='Latencia media (s) del stub de precios.')
+@click.option('--race-slots', type=click.IntRange(1), default=3, show_default=True,
+              help='Horarios por los que compiten las reservas.')
+@click.option('--scenario', 'scenarios', type=click.Choice(SCENARIOS), multiple=True,
+              help='Escenarios a correr (por defecto todos).')
+@click.option('--json', 'as_json', is_flag=True, help='Salida en JSON.')
+@click.option('--keep', is_flag=True, help='No borrar la base temporal.')
+def main(workers, threads, users, duration, pricing_latency, race_slots, scenarios, as_json, keep):
+    """Prueba de carga local: gunicorn + base temporal + stub de precios."""
+    scenarios = scenarios or SCENARIOS
+    tmp = Path(tempfile.mkdtemp(prefix='subite-bench-'))
+    db_path = tmp / 'bench.db'
+    stub, pricing_url = start_pricing_stub(latency=pricing_latency)
+    reports = []
+    try:
+        env = app_env(db_path, pricing_url)
+        seed_database(env)
+        with AppServer(env, workers=workers, threads=threads) as server:
+            if not as_json:
+                print(f'app en {server.url} ({workers} workers), stub de precios en {pricing_url}, base {db_path}')
+            if 'availability' in scenarios:
+                reports.append(availability_scenario(server.url, users, duration).report())
+            if 'booking' in scenarios:
+                reports.append(booking_race_scenario(server.url, db_path, users, duration, race_slots).report())
+            if 'admin' in scenarios:
+                reports.append(admin_scenario(server.url, users, duration).report())
+    finally:
+        stub.shutdown()
+        if not keep:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    if as_json:
+        print(json.dumps({'pricing_calls': stub.calls, 'scenarios': reports}, indent=2))
+    else:
+        print_table(reports)
+        print(f'cotizaciones atendidas por el stub: {stub.calls}')
+
+
+if __name__ == '__main__':
+    main()
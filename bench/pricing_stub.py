@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Stub HTTP de la API de precios (/precio y /precio_general) con latencia configurable."""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class PricingStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            payload = {}
+
+        server = self.server
+        time.sleep(max(0.0, random.gauss(server.latency, server.latency * server.jitter)))
+
+        km = 5 + len(json.dumps(payload)) % 40
+        km_price = float(payload.get('precio_km') or 100)
+        if self.path.startswith('/precio_general'):
+            body = {'precio': round(km * 20 * km_price, 2), 'km': km * 20}
+        elif self.path.startswith('/precio'):
+            body = {'precio': round(km * km_price, 2)}
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        with server.lock:
+            server.calls += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_pricing_stub(latency=0.15, jitter=0.2, host='127.0.0.1', port=0):
+    """Arranca el stub en un thread. Devuelve (server, url); server.calls cuenta
+       las cotizaciones atendidas y server.shutdown() lo detiene.
+    """
+    server = ThreadingHTTPServer((host, port), PricingStubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.calls = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name='pricing-stub', daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Escenarios concurrentes y sus estadísticas."""
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+from bench.server import ADMIN_PASSWORD
+
+ROUTES = ('RC-CBA', 'CBA-RC')
+
+
+def percentile(sorted_values, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+class Stats:
+    """Latencias y resultados de un escenario (thread-safe)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.outcomes = {'ok': 0, 'rejected': 0, 'error': 0}
+        self.extra = {}
+        self.started = self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, latency, outcome):
+        with self._lock:
+            self.latencies.append(latency)
+            self.outcomes[outcome] += 1
+
+    def report(self):
+        total = len(self.latencies)
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        lat = sorted(self.latencies)
+        return {
+            'scenario': self.name,
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(lat, 50) * 1000, 1),
+            'p95_ms': round(percentile(lat, 95) * 1000, 1),
+            'p99_ms': round(percentile(lat, 99) * 1000, 1),
+            'error_rate': round(self.outcomes['error'] / total, 4) if total else 0.0,
+            **self.outcomes,
+            **self.extra,
+        }
+
+
+def timed(stats, session, method, url, rejected_on_redirect=False, **kwargs):
+    """Hace el request y lo registra: 2xx ok, 3xx rechazado (si corresponde), resto error."""
+    start = time.perf_counter()
+    try:
+        response = session.request(method, url, allow_redirects=False, timeout=30, **kwargs)
+    except requests.RequestException:
+        stats.record(time.perf_counter() - start, 'error')
+        return None
+    latency = time.perf_counter() - start
+    if response.status_code < 300 or (response.status_code < 400 and not rejected_on_redirect):
+        stats.record(latency, 'ok')
+    elif response.status_code < 400:
+        stats.record(latency, 'rejected')
+    else:
+        stats.record(latency, 'error')
+    return response
+
+
+def run_users(stats, users, duration, user_loop):
+    """Corre `users` usuarios concurrentes, cada uno con su Session, hasta que
+       pasen `duration` segundos o `user_loop` devuelva False.
+    """
+    deadline = time.monotonic() + duration
+
+    def user(n):
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                if user_loop(session, n) is False:
+                    return
+
+    stats.started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    stats.finished = time.perf_counter()
+    return stats
+
+
+def availability_scenario(base_url, users, duration):
+    """Búsquedas: la mitad por /api/availability (JSON) y la mitad por el formulario /shared."""
+    stats = Stats('availability')
+
+    def loop(session, n):
+        route = random.choice(ROUTES)
+        on_date = (date.today() + timedelta(days=random.randint(0, 14))).isoformat()
+        passengers = random.randint(1, 4)
+        if random.random() < 0.5:
+            timed(stats, session, 'GET', f'{base_url}/api/availability',
+                  params={'route': route, 'date': on_date, 'p': passengers})
+        else:
+            timed(stats, session, 'POST', f'{base_url}/shared',
+                  data={'route': route, 'date': on_date, 'passengers': passengers})
+
+    return run_users(stats, users, duration, loop)
+
+
+def booking_race_scenario(base_url, db_path, users, duration, slots=3, days_ahead=3):
+    """Todos los usuarios reservan a la vez los mismos `slots` horarios hasta
+       llenarlos. Al final cuenta en la base los asientos vendidos de más.
+    """
+    stats = Stats('booking_race')
+    on_date = (date.today() + timedelta(days=days_ahead)).isoformat()
+    listing = requests.get(f'{base_url}/api/availability',
+                           params={'route': 'RC-CBA', 'date': on_date, 'p': 1}, timeout=30).json()
+    targets = [s['book_url'].split('?')[0] for s in listing.get('slots', [])[:slots]]
+    if not targets:
+        raise RuntimeError(f'no hay horarios RC-CBA el {on_date} para el escenario de reservas')
+    full = set()
+    lock = threading.Lock()
+
+    def loop(session, n):
+        with lock:
+            open_slots = [t for t in targets if t not in full]
+        if not open_slots:
+            return False
+        target = random.choice(open_slots)
+        passengers = random.randint(1, 2)
+        response = timed(stats, session, 'POST', f'{base_url}{target}', rejected_on_redirect=True,
+                         params={'p': passengers},
+                         data={
+                             'name': f'Bench {n}', 'phone': '3580000000',
+                             'pickup_address': 'Terminal',
+                             # dirección distinta cada vez: obliga a cotizar contra el stub
+                             'final_address_select': 'otro',
+                             'final_address_custom': f'Calle {random.randint(1, 10 ** 6)}',
+                         })
+        if response is not None and response.status_code in (302, 303) and passengers == 1:
+            with lock:
+                full.add(target)
+
+    run_users(stats, users, duration, loop)
+    stats.extra.update(oversell_report(db_path))
+    return stats
+
+
+def oversell_report(db_path):
+    """Asientos vendidos por encima de la capacidad y horarios cuyo seats_taken
+       no coincide con la suma de sus reservas.
+    """
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            'SELECT t.capacity, t.seats_taken, COALESCE(SUM(b.passengers), 0) '
+            'FROM trip_schedule t LEFT JOIN shared_booking b ON b.schedule_id = t.id '
+            'GROUP BY t.id'
+        ).fetchall()
+    return {
+        'booked_seats': sum(booked for _, _, booked in rows),
+        'oversold': sum(max(0, booked - capacity) for capacity, _, booked in rows),
+        'seat_drift': sum(1 for _, taken, booked in rows if taken != booked),
+    }
+
+
+def admin_scenario(base_url, users, duration):
+    """Páginas del admin con sesión iniciada."""
+    stats = Stats('admin')
+    pages = ['/admin', '/admin/schedules', '/admin/bookings?type=shared',
+             '/admin/bookings?type=anywhere', '/shared/calendar']
+
+    def loop(session, n):
+        if 'session' not in session.cookies:
+            session.post(f'{base_url}/admin/login', data={'password': ADMIN_PASSWORD},
+                         allow_redirects=False, timeout=30)
+        timed(stats, session, 'GET', base_url + random.choice(pages))
+
+    return run_users(stats, users, duration, loop)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Base temporal sembrada y la app corriendo bajo gunicorn."""
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+ADMIN_PASSWORD = 'bench'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def app_env(db_path, pricing_url):
+    """Entorno de la app: base temporal, API de precios local y sin recargo externo."""
+    env = dict(os.environ)
+    env.pop('PICKUP_API_URL', None)
+    env.update({
+        'DATABASE_URL': f'sqlite:///{db_path}',
+        'PRICING_API_URL': pricing_url,
+        'ADMIN_PASSWORD': ADMIN_PASSWORD,
+        'SECRET_KEY': 'bench',
+        'FLASK_APP': 'app',
+    })
+    return env
+
+
+def seed_database(env):
+    """Crea las tablas y siembra precios y plantillas con `flask initdb`."""
+    subprocess.run([sys.executable, '-m', 'flask', 'initdb'], cwd=REPO_DIR, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+class AppServer:
+    """gunicorn con `workers` procesos; se usa como context manager."""
+
+    def __init__(self, env, workers=4, threads=1, port=None):
+        self.env = env
+        self.workers = workers
+        self.threads = threads
+        self.port = port or free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.process = None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app',
+             '--bind', f'127.0.0.1:{self.port}',
+             '--workers', str(self.workers), '--threads', str(self.threads),
+             '--log-level', 'warning'],
+            cwd=REPO_DIR, env=self.env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn terminó al arrancar (¿está instalado? pip install -r bench/requirements.txt)')
+            try:
+                requests.get(self.url + '/', timeout=1)
+                return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.__exit__(None, None, None)
+        raise RuntimeError('la app no respondió a tiempo')
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Métricas en memoria del proceso, expuestas en formato de texto de Prometheus.
+
+Por cada request se mide el tiempo total y la cantidad de sentencias SQL, con
+la regla de la URL como etiqueta (p.ej. /shared/book/<int:schedule_id>), y se
+miden las llamadas a las APIs de precios con su resultado. Cada worker tiene sus
+propios contadores: con varios workers cada scrape ve sólo el que atendió.
+"""
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels
+    )
+    return '{' + pairs + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_label_text(key)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [conteo por bucket..., suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{_label_text(key + (("le", _number(bound)),))} {count}')
+                lines.append(f'{self.name}_bucket{_label_text(key + (("le", "+Inf"),))} {series[-1]}')
+                lines.append(f'{self.name}_sum{_label_text(key)} {_number(series[-2])}')
+                lines.append(f'{self.name}_count{_label_text(key)} {series[-1]}')
+        return lines
+
+
+request_duration = Histogram('subite_request_duration_seconds',
+                             'Tiempo total de cada request por endpoint.')
+request_sql = Histogram('subite_request_sql_statements',
+                        'Sentencias SQL ejecutadas por request.', SQL_BUCKETS)
+requests_total = Counter('subite_requests_total', 'Requests atendidos por endpoint y estado.')
+upstream_duration = Histogram('subite_upstream_duration_seconds',
+                              'Latencia de las consultas de precio por función y resultado.')
+
+REGISTRY = (request_duration, request_sql, requests_total, upstream_duration)
+
+
+def render():
+    """Todas las métricas en el formato de texto de Prometheus (0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+def timed_upstream(name):
+    """Decorador: mide la llamada y la cuenta como 'error' si lanza o devuelve None."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = fn(*args, **kwargs)
+                if result is not None:
+                    outcome = 'ok'
+                return result
+            finally:
+                upstream_duration.observe(time.perf_counter() - start, call=name, outcome=outcome)
+        return wrapper
+    return decorator
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_sql = g.get('metrics_sql', 0) + 1
+
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule is not None else '<sin ruta>'
+
+
+def init_app(app):
+    """Registra los hooks de request y el contador de SQL de todos los engines."""
+    if not event.contains(Engine, 'before_cursor_execute', _count_statement):
+        event.listen(Engine, 'before_cursor_execute', _count_statement)
+
+    @app.before_request
+    def _metrics_start():
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql = 0
+
+    @app.after_request
+    def _metrics_record(response):
+        if 'metrics_start' in g:
+            endpoint = _endpoint()
+            request_duration.observe(time.perf_counter() - g.metrics_start,
+                                     endpoint=endpoint, method=request.method)
+            request_sql.observe(g.metrics_sql, endpoint=endpoint)
+            requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        return response
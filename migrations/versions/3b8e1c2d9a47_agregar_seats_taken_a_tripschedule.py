@@ -0,0 +1,33 @@
+"""Agregar seats_taken a TripSchedule
+
+Revision ID: 3b8e1c2d9a47
+Revises: f47522e53005
+Create Date: 2026-10-17 10:12:41.208114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8e1c2d9a47'
+down_revision = 'f47522e53005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('trip_schedule', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seats_taken', sa.Integer(), nullable=False, server_default='0'))
+
+    # Inicializamos el contador con las reservas que ya existen
+    op.execute(
+        "UPDATE trip_schedule SET seats_taken = ("
+        " SELECT COALESCE(SUM(shared_booking.passengers), 0)"
+        " FROM shared_booking WHERE shared_booking.schedule_id = trip_schedule.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('trip_schedule', schema=None) as batch_op:
+        batch_op.drop_column('seats_taken')
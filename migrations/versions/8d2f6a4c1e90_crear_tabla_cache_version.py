@@ -0,0 +1,28 @@
+"""Crear tabla CacheVersion
+
+Revision ID: 8d2f6a4c1e90
+Revises: 3b8e1c2d9a47
+Create Date: 2026-10-17 11:03:17.552940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2f6a4c1e90'
+down_revision = '3b8e1c2d9a47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_version',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_version')
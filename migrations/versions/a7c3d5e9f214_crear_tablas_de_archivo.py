@@ -0,0 +1,129 @@
+"""Crear tablas de archivo para viajes y reservas
+
+Revision ID: a7c3d5e9f214
+Revises: e1f04b7d6c38
+Create Date: 2026-10-17 16:05:12.408317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3d5e9f214'
+down_revision = 'e1f04b7d6c38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trip_schedule_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('route', sa.String(length=32), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('time', sa.String(length=5), nullable=False),
+    sa.Column('capacity', sa.Integer(), nullable=False),
+    sa.Column('seats_taken', sa.Integer(), nullable=False),
+    sa.Column('created_from_recurring_id', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_trip_schedule_archive_date', 'trip_schedule_archive', ['date'], unique=False)
+
+    op.create_table('shared_booking_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('schedule_id', sa.Integer(), nullable=False),
+    sa.Column('passengers', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('phone', sa.String(length=40), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=True),
+    sa.Column('pickup_address', sa.String(length=200), nullable=True),
+    sa.Column('final_address', sa.String(length=200), nullable=True),
+    sa.Column('extra_luggage', sa.Boolean(), nullable=True),
+    sa.Column('pet', sa.Boolean(), nullable=True),
+    sa.Column('total_price', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_shared_booking_archive_schedule_id', 'shared_booking_archive', ['schedule_id'], unique=False)
+    op.create_index('ix_shared_booking_archive_created_at', 'shared_booking_archive', ['created_at'], unique=False)
+
+    op.create_table('parcel_booking_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('route', sa.String(length=32), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('parcels', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('phone', sa.String(length=40), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=True),
+    sa.Column('total_price', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('pickup_address', sa.String(length=200), nullable=True),
+    sa.Column('final_address', sa.String(length=200), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_parcel_booking_archive_created_at', 'parcel_booking_archive', ['created_at'], unique=False)
+
+    op.create_table('airport_exclusive_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('time', sa.String(length=5), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('phone', sa.String(length=40), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=True),
+    sa.Column('pickup_address', sa.String(length=200), nullable=False),
+    sa.Column('final_address', sa.String(length=200), nullable=False),
+    sa.Column('total_price', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_airport_exclusive_archive_created_at', 'airport_exclusive_archive', ['created_at'], unique=False)
+
+    op.create_table('city_exclusive_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('route', sa.String(length=32), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('time', sa.String(length=5), nullable=False),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('phone', sa.String(length=40), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=True),
+    sa.Column('pickup_address', sa.String(length=200), nullable=False),
+    sa.Column('final_address', sa.String(length=200), nullable=False),
+    sa.Column('total_price', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_city_exclusive_archive_created_at', 'city_exclusive_archive', ['created_at'], unique=False)
+
+    op.create_table('anywhere_booking_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('time', sa.String(length=5), nullable=False),
+    sa.Column('origin_city', sa.String(length=200), nullable=False),
+    sa.Column('origin_street', sa.String(length=200), nullable=False),
+    sa.Column('destination_street', sa.String(length=200), nullable=False),
+    sa.Column('destination_city', sa.String(length=200), nullable=False),
+    sa.Column('km_estimate', sa.Float(), nullable=True),
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('phone', sa.String(length=40), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=True),
+    sa.Column('total_price', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_anywhere_booking_archive_created_at', 'anywhere_booking_archive', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_anywhere_booking_archive_created_at', table_name='anywhere_booking_archive')
+    op.drop_table('anywhere_booking_archive')
+    op.drop_index('ix_city_exclusive_archive_created_at', table_name='city_exclusive_archive')
+    op.drop_table('city_exclusive_archive')
+    op.drop_index('ix_airport_exclusive_archive_created_at', table_name='airport_exclusive_archive')
+    op.drop_table('airport_exclusive_archive')
+    op.drop_index('ix_parcel_booking_archive_created_at', table_name='parcel_booking_archive')
+    op.drop_table('parcel_booking_archive')
+    op.drop_index('ix_shared_booking_archive_created_at', table_name='shared_booking_archive')
+    op.drop_index('ix_shared_booking_archive_schedule_id', table_name='shared_booking_archive')
+    op.drop_table('shared_booking_archive')
+    op.drop_index('ix_trip_schedule_archive_date', table_name='trip_schedule_archive')
+    op.drop_table('trip_schedule_archive')
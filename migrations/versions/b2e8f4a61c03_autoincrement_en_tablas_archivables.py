@@ -0,0 +1,47 @@
+"""AUTOINCREMENT en las tablas que se archivan
+
+Revision ID: b2e8f4a61c03
+Revises: a7c3d5e9f214
+Create Date: 2026-10-17 18:42:37.915204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e8f4a61c03'
+down_revision = 'a7c3d5e9f214'
+branch_labels = None
+depends_on = None
+
+# Sin AUTOINCREMENT SQLite vuelve a usar el id más alto cuando esa fila se
+# archiva, y la próxima copia choca con el id que ya está en <tabla>_archive.
+TABLES = ('trip_schedule', 'shared_booking', 'parcel_booking',
+          'airport_exclusive', 'city_exclusive', 'anywhere_booking')
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        # en Postgres las secuencias nunca reutilizan ids
+        return
+    for table in TABLES:
+        with op.batch_alter_table(table, recreate='always',
+                                  table_kwargs={'sqlite_autoincrement': True}):
+            pass
+        # La secuencia arranca después del id más alto, vivo o archivado
+        op.execute(sa.text(
+            f"DELETE FROM sqlite_sequence WHERE name = '{table}'"
+        ))
+        op.execute(sa.text(
+            f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table}', max(coalesce(max_id, 0)) FROM ("
+            f"SELECT max(id) AS max_id FROM {table} UNION ALL SELECT max(id) FROM {table}_archive)"
+        ))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in TABLES:
+        with op.batch_alter_table(table, recreate='always'):
+            pass
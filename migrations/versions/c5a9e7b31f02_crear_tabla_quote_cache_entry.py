@@ -0,0 +1,30 @@
+"""Crear tabla QuoteCacheEntry
+
+Revision ID: c5a9e7b31f02
+Revises: 8d2f6a4c1e90
+Create Date: 2026-10-17 11:48:05.913377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a9e7b31f02'
+down_revision = '8d2f6a4c1e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('quote_cache_entry',
+    sa.Column('key', sa.String(length=40), nullable=False),
+    sa.Column('km_price', sa.Float(), nullable=False),
+    sa.Column('value', sa.Text(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('quote_cache_entry')
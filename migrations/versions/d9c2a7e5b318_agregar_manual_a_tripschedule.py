@@ -0,0 +1,43 @@
+"""Agregar manual a TripSchedule
+
+Revision ID: d9c2a7e5b318
+Revises: b2e8f4a61c03
+Create Date: 2026-10-17 19:20:08.553612
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9c2a7e5b318'
+down_revision = 'b2e8f4a61c03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Horarios cargados a mano desde el admin: cleanup-slots no los borra.
+    # Los que ya existen quedan en 0 porque no hay forma de distinguirlos.
+    # ADD COLUMN sin recrear la tabla: así conserva AUTOINCREMENT y su secuencia
+    op.add_column('trip_schedule', sa.Column('manual', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    # El archivo copia todas las columnas del viaje
+    op.add_column('trip_schedule_archive', sa.Column('manual', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table('trip_schedule_archive', schema=None) as batch_op:
+        batch_op.drop_column('manual')
+
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        # recrear la tabla reinicia la secuencia al id vivo más alto: guardarla
+        seq = op.get_bind().execute(sa.text(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'trip_schedule'")).scalar()
+    with op.batch_alter_table('trip_schedule', schema=None,
+                              table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.drop_column('manual')
+    if sqlite and seq is not None:
+        op.execute(sa.text("DELETE FROM sqlite_sequence WHERE name = 'trip_schedule'"))
+        op.execute(sa.text(f"INSERT INTO sqlite_sequence (name, seq) VALUES ('trip_schedule', {int(seq)})"))
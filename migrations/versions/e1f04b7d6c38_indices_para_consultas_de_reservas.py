@@ -0,0 +1,63 @@
+"""Índices para las consultas de horarios y reservas
+
+Revision ID: e1f04b7d6c38
+Revises: c5a9e7b31f02
+Create Date: 2026-10-17 12:40:52.117604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f04b7d6c38'
+down_revision = 'c5a9e7b31f02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Antes del índice único: unificar horarios duplicados (route, date, time)
+    # pasando sus reservas al de menor id.
+    op.execute(
+        "UPDATE shared_booking SET schedule_id = ("
+        " SELECT MIN(t2.id) FROM trip_schedule t1"
+        " JOIN trip_schedule t2 ON t2.route = t1.route AND t2.date = t1.date AND t2.time = t1.time"
+        " WHERE t1.id = shared_booking.schedule_id)"
+        " WHERE schedule_id IN (SELECT id FROM trip_schedule)"
+    )
+    op.execute(
+        "DELETE FROM trip_schedule WHERE id NOT IN ("
+        " SELECT MIN(id) FROM trip_schedule GROUP BY route, date, time)"
+    )
+    op.execute(
+        "UPDATE trip_schedule SET seats_taken = ("
+        " SELECT COALESCE(SUM(shared_booking.passengers), 0)"
+        " FROM shared_booking WHERE shared_booking.schedule_id = trip_schedule.id)"
+    )
+
+    with op.batch_alter_table('trip_schedule', schema=None) as batch_op:
+        batch_op.create_index('ux_trip_schedule_route_date_time', ['route', 'date', 'time'], unique=True)
+        batch_op.create_index('ix_trip_schedule_created_from_recurring_id', ['created_from_recurring_id'], unique=False)
+
+    with op.batch_alter_table('shared_booking', schema=None) as batch_op:
+        batch_op.create_index('ix_shared_booking_schedule_id', ['schedule_id'], unique=False)
+        batch_op.create_index('ix_shared_booking_created_at', ['created_at'], unique=False)
+
+    for table in ('parcel_booking', 'airport_exclusive', 'city_exclusive', 'anywhere_booking'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_index(f'ix_{table}_created_at', ['created_at'], unique=False)
+
+
+def downgrade():
+    for table in ('parcel_booking', 'airport_exclusive', 'city_exclusive', 'anywhere_booking'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{table}_created_at')
+
+    with op.batch_alter_table('shared_booking', schema=None) as batch_op:
+        batch_op.drop_index('ix_shared_booking_created_at')
+        batch_op.drop_index('ix_shared_booking_schedule_id')
+
+    with op.batch_alter_table('trip_schedule', schema=None) as batch_op:
+        batch_op.drop_index('ix_trip_schedule_created_from_recurring_id')
+        batch_op.drop_index('ux_trip_schedule_route_date_time')
@@ -0,0 +1,26 @@
+"""Índice por fecha en TripSchedule
+
+Revision ID: f3a61d8c4b27
+Revises: d9c2a7e5b318
+Create Date: 2026-10-17 19:48:51.107342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a61d8c4b27'
+down_revision = 'd9c2a7e5b318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ux_trip_schedule_route_date_time empieza por la ruta: no sirve para
+    # filtrar sólo por fecha (listado del admin, cleanup-slots, archive)
+    op.create_index('ix_trip_schedule_date', 'trip_schedule', ['date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_trip_schedule_date', table_name='trip_schedule')
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Cliente HTTP compartido para las APIs de precios.
+
+Todas las llamadas salientes pasan por una única requests.Session (conexiones
+keep-alive reutilizadas), con timeouts de conexión/lectura, reintentos acotados
+con jitter y un circuit breaker que corta rápido mientras la API está caída.
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+PRICING_API_URL = os.getenv('PRICING_API_URL', 'https://api.refreshagency.duckdns.org')
+
+
+class CircuitOpenError(requests.RequestException):
+    """La API falló demasiadas veces seguidas; no se intenta hasta que pase reset_after."""
+
+
+class CircuitBreaker:
+    """Abre el circuito tras `threshold` fallas seguidas y deja pasar una
+       llamada de prueba cuando pasaron `reset_after` segundos.
+    """
+
+    def __init__(self, threshold=5, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                # medio abierto: una sola llamada de prueba
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class PricingClient:
+    """Cliente compartido; cada host tiene su propio circuit breaker, así la caída
+       de una API (p.ej. PICKUP_API_URL) no corta las llamadas a las otras.
+    """
+
+    def __init__(self, base_url=PRICING_API_URL, connect_timeout=3.05, read_timeout=10.0,
+                 retries=2, backoff=0.3, pool_size=10, breaker_threshold=5, breaker_reset=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.breakers = {}  # netloc -> CircuitBreaker
+        self._breakers_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            base_url=PRICING_API_URL,
+            connect_timeout=float(os.getenv('PRICING_CONNECT_TIMEOUT', 3.05)),
+            read_timeout=float(os.getenv('PRICING_READ_TIMEOUT', 10)),
+            retries=int(os.getenv('PRICING_RETRIES', 2)),
+            pool_size=int(os.getenv('PRICING_POOL_SIZE', 10)),
+            breaker_threshold=int(os.getenv('PRICING_BREAKER_THRESHOLD', 5)),
+            breaker_reset=float(os.getenv('PRICING_BREAKER_RESET', 30)),
+        )
+
+    def url(self, path):
+        if path.startswith(('http://', 'https://')):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def breaker_for(self, url):
+        """Circuit breaker del host de `url` (se crea la primera vez)."""
+        host = urlsplit(url).netloc
+        with self._breakers_lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return breaker
+
+    def post_json(self, path, payload):
+        """POST con cuerpo JSON; devuelve el JSON de la respuesta.
+           Reintenta errores de red, timeouts y 5xx; un 4xx se lanza enseguida.
+           Lanza requests.RequestException (o CircuitOpenError) si no hay respuesta válida.
+        """
+        url = self.url(path)
+        breaker = self.breaker_for(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuito abierto para {urlsplit(url).netloc}")
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.json()
+            except requests.HTTPError as e:
+                status = e.response.status_code if e.response is not None else 0
+                if status < 500:
+                    # el servidor respondió: no cuenta como caída
+                    breaker.success()
+                    raise
+                error = e
+            except (requests.ConnectionError, requests.Timeout, ValueError) as e:
+                error = e
+            else:
+                breaker.success()
+                return data
+
+            attempt += 1
+            if attempt > self.retries:
+                breaker.failure()
+                if isinstance(error, requests.RequestException):
+                    raise error
+                raise requests.RequestException(f"Respuesta inválida de {url}: {error}")
+            # backoff exponencial con jitter completo
+            time.sleep(random.uniform(0, self.backoff * (2 ** (attempt - 1))))
+
+
+pricing_client = PricingClient.from_env()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Auditoría de consultas SQL para desarrollo y pruebas.
+
+Con QUERY_AUDIT=1 cada request cuenta sus sentencias, avisa cuando la misma
+forma de consulta se repite muchas veces (el típico N+1 en un loop o en un
+template) y registra las sentencias lentas junto con su EXPLAIN QUERY PLAN
+de SQLite. Además `query_budget` sirve para que una prueba falle si una vista
+se pasa de la cantidad de consultas prevista:
+
+    with query_budget(3):
+        client.post('/shared', data={...})
+"""
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_IN_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Forma de una sentencia: sin literales y con las listas IN (?, ?, ...) colapsadas,
+       para que dos consultas iguales con distintos valores cuenten como una.
+    """
+    shape = _LITERAL.sub('?', statement)
+    shape = _IN_LIST.sub('(?)', shape)
+    return _SPACES.sub(' ', shape).strip()
+
+
+def explain_query_plan(dbapi_connection, statement, parameters):
+    """EXPLAIN QUERY PLAN de SQLite en un cursor aparte (no toca el de la consulta)."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())
+        return [row[-1] for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'(sin plan: {e})']
+    finally:
+        cursor.close()
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('audit_start', []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('audit_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if not has_request_context() or 'audit_shapes' not in g:
+        return
+    g.audit_shapes[statement_shape(statement)] += 1
+
+    config = current_app.config
+    if elapsed * 1000 >= config['SLOW_QUERY_MS']:
+        plan = []
+        if (conn.dialect.name == 'sqlite' and not executemany
+                and statement.lstrip().upper().startswith(('SELECT', 'WITH'))):
+            plan = explain_query_plan(conn.connection.dbapi_connection, statement, parameters)
+        current_app.logger.warning(
+            'Consulta lenta (%.1f ms) en %s: %s%s', elapsed * 1000, request.path, statement,
+            ''.join(f'\n    plan: {step}' for step in plan)
+        )
+
+
+def init_app(app):
+    """Activa la auditoría por request. Lee QUERY_AUDIT_REPEAT (repeticiones de una
+       misma forma que se consideran N+1) y SLOW_QUERY_MS de la config.
+    """
+    app.config.setdefault('QUERY_AUDIT_REPEAT', 5)
+    app.config.setdefault('SLOW_QUERY_MS', 100)
+    if not event.contains(Engine, 'before_cursor_execute', _before_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_execute)
+
+    @app.before_request
+    def _audit_start():
+        g.audit_shapes = Counter()
+
+    @app.after_request
+    def _audit_report(response):
+        shapes = g.pop('audit_shapes', None)
+        if shapes is None:
+            return response
+        total = sum(shapes.values())
+        response.headers['X-Query-Count'] = str(total)
+        for shape, count in shapes.most_common():
+            if count < app.config['QUERY_AUDIT_REPEAT']:
+                break
+            app.logger.warning('Posible N+1 en %s %s: %d× %s', request.method, request.path, count, shape)
+        return response
+
+
+class QueryLog:
+    """Sentencias ejecutadas dentro de un bloque `query_budget`."""
+
+    def __init__(self):
+        self.statements = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.statements)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.statements.append(statement)
+
+    def summary(self):
+        counts = Counter(statement_shape(s) for s in self.statements)
+        return '\n'.join(f'  {n}× {shape}' for shape, n in counts.most_common())
+
+
+@contextmanager
+def query_budget(max_statements):
+    """Falla con AssertionError si el bloque ejecuta más de `max_statements`
+       sentencias SQL (en cualquier engine). Devuelve el QueryLog del bloque.
+    """
+    log = QueryLog()
+    event.listen(Engine, 'before_cursor_execute', log.record)
+    try:
+        yield log
+    finally:
+        event.remove(Engine, 'before_cursor_execute', log.record)
+    if len(log) > max_statements:
+        raise AssertionError(
+            f'Se ejecutaron {len(log)} sentencias SQL (presupuesto: {max_statements}):\n{log.summary()}'
+        )
+
+
+def assert_view_budget(client, method, url, max_statements, **kwargs):
+    """Hace el request con el test client de Flask dentro de `query_budget` y
+       devuelve la respuesta: `assert_view_budget(client, 'get', '/admin/schedules', 5)`.
+    """
+    with query_budget(max_statements):
+        return getattr(client, method.lower())(url, **kwargs)